@@ -1,16 +1,129 @@
-from flask import Flask, jsonify, Response, request
+from flask import Flask, jsonify, Response, request, stream_with_context
 import requests
+import click
 from bs4 import BeautifulSoup
 import os
 from flask_cors import CORS
 import json
+import logging
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import re
+import gzip
+import multiprocessing
+import select
+import socket
+import fcntl
+import tempfile
+import hashlib
+import importlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from urllib.parse import urlencode
+from werkzeug.http import parse_date as parse_http_date
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_batch, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 import numpy as np
-from scipy.special import comb, factorial
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from scipy.special import comb
+from scipy.stats import binom as binom_dist
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Async serving mode: run under gunicorn's gevent worker
+# (`gunicorn -k gevent --worker-connections 100 app:app`). Requests, sockets,
+# locks and the background threads become cooperative once gevent has
+# monkey-patched the process; psycogreen does the same for psycopg2.
+def gevent_active():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+if gevent_active():
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics, served at /metrics. Under several gunicorn workers set
+# PROMETHEUS_MULTIPROC_DIR (an empty directory) so every worker and pricing
+# process writes to shared files that /metrics aggregates.
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by route', ['method', 'route', 'status']
+)
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Time in cursor.execute by statement and table', ['statement', 'table']
+)
+NRL_FETCH_SECONDS = Histogram(
+    'nrl_fetch_duration_seconds', 'nrl.com request latency', ['path', 'status']
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Cache lookups by cache and result', ['cache', 'result']
+)
+SGM_PRICING_SECONDS = Histogram(
+    'sgm_pricing_duration_seconds', 'SGM pricing wall time, including the pricing pool', ['engine'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+SGM_LEGS = Histogram(
+    'sgm_legs', 'Player legs (K) per priced combination', ['mode'],
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+)
+SGM_MAX_TRIES = Histogram(
+    'sgm_max_tries', 'Highest team try count (n) in the priced distribution', ['mode'],
+    buckets=(5, 10, 15, 20, 30, 50, 100, 250, 1000)
+)
+SGM_EVALUATED = Counter(
+    'sgm_evaluated_total', 'Distinct leg combinations, bins or Monte Carlo samples evaluated', ['mode', 'unit']
+)
+SGM_REJECTED = Counter(
+    'sgm_rejected_total', 'Pricing requests refused or abandoned', ['reason']
+)
+
+@lru_cache(maxsize=512)
+def query_labels(query):
+    """(statement, table) labels for a SQL string, e.g. ('select', 'matches')."""
+    statement = re.match(r'\s*(\w*)', query).group(1).lower() or 'unknown'
+    table = re.search(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+([\w.]+)', query, re.IGNORECASE)
+    return statement, table.group(1).lower() if table else ''
+
+class TimedCursorMixin:
+    """Records every execute in DB_QUERY_SECONDS."""
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            sql = query.decode() if isinstance(query, bytes) else str(query)
+            DB_QUERY_SECONDS.labels(*query_labels(sql)).observe(time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            sql = query.decode() if isinstance(query, bytes) else str(query)
+            DB_QUERY_SECONDS.labels(*query_labels(sql)).observe(time.perf_counter() - start)
+
+class TimedCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+class TimedDictCursor(TimedCursorMixin, RealDictCursor):
+    pass
 
 def get_db_connection():
     return psycopg2.connect(
@@ -20,20 +133,266 @@ def get_db_connection():
         password=os.environ.get('PGPASSWORD')
     )
 
+# Per-worker connection pool, created lazily so each forked gunicorn worker gets its own
+PGPOOL_MIN = int(os.environ.get('PGPOOL_MIN', 1))
+PGPOOL_MAX = int(os.environ.get('PGPOOL_MAX', 10))
+PGPOOL_CHECK_AFTER = float(os.environ.get('PGPOOL_CHECK_AFTER', 30))  # idle seconds before a SELECT 1 check
+PGPOOL_WAIT = float(os.environ.get('PGPOOL_WAIT', 5))  # seconds to wait for a free connection
+
+db_pool = {
+    "pool": None,
+    "pid": None,
+    "last_used": {},  # id(conn) -> time returned to the pool
+    "slots": None,  # bounds checkouts so callers queue instead of failing when the pool is busy
+    "lock": threading.Lock(),
+    "stats": {"checkouts": 0, "in_use": 0, "discarded": 0, "health_checks": 0, "exhausted": 0}
+}
+
+def get_db_pool():
+    if db_pool["pool"] is None or db_pool["pid"] != os.getpid():
+        with db_pool["lock"]:
+            if db_pool["pool"] is None or db_pool["pid"] != os.getpid():
+                db_pool["pool"] = ThreadedConnectionPool(
+                    PGPOOL_MIN, PGPOOL_MAX,
+                    host=os.environ.get('PGHOST'),
+                    dbname=os.environ.get('PGDATABASE'),
+                    user=os.environ.get('PGUSER'),
+                    password=os.environ.get('PGPASSWORD'),
+                    cursor_factory=TimedCursor
+                )
+                db_pool["pid"] = os.getpid()
+                db_pool["last_used"] = {}
+                db_pool["slots"] = threading.BoundedSemaphore(PGPOOL_MAX)
+    return db_pool["pool"]
+
+def checkout_db_connection():
+    """
+    Take a connection from the pool, replacing it if it has been closed or,
+    after sitting idle for PGPOOL_CHECK_AFTER seconds, fails a SELECT 1.
+    """
+    pool = get_db_pool()
+    if not db_pool["slots"].acquire(timeout=PGPOOL_WAIT):
+        with db_pool["lock"]:
+            db_pool["stats"]["exhausted"] += 1
+        raise PoolError("connection pool exhausted")
+    try:
+        for _ in range(PGPOOL_MAX + 1):
+            conn = pool.getconn()
+            healthy = not conn.closed
+            last_used = db_pool["last_used"].get(id(conn))
+            idle = time.time() - last_used if last_used else 0  # new connections skip the check
+            if healthy and idle > PGPOOL_CHECK_AFTER:
+                with db_pool["lock"]:
+                    db_pool["stats"]["health_checks"] += 1
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                except psycopg2.Error:
+                    healthy = False
+            if healthy:
+                with db_pool["lock"]:
+                    db_pool["stats"]["checkouts"] += 1
+                    db_pool["stats"]["in_use"] += 1
+                return conn
+            with db_pool["lock"]:
+                db_pool["stats"]["discarded"] += 1
+                db_pool["last_used"].pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise PoolError("no healthy connection available")
+    except BaseException:
+        db_pool["slots"].release()
+        raise
+
+def release_db_connection(conn, failed=False):
+    pool = get_db_pool()
+    close = bool(conn.closed)
+    if not close:
+        try:
+            if failed:
+                conn.rollback()
+            else:
+                conn.commit()
+        except psycopg2.Error:
+            close = True
+    with db_pool["lock"]:
+        db_pool["stats"]["in_use"] -= 1
+        if close:
+            db_pool["stats"]["discarded"] += 1
+            db_pool["last_used"].pop(id(conn), None)
+        else:
+            db_pool["last_used"][id(conn)] = time.time()
+    pool.putconn(conn, close=close)
+    db_pool["slots"].release()
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; it always goes back to the pool, even on error."""
+    conn = checkout_db_connection()
+    try:
+        yield conn
+    except BaseException:
+        release_db_connection(conn, failed=True)
+        raise
+    release_db_connection(conn)
+
+@contextmanager
+def db_cursor(name=None):
+    """
+    Pooled connection plus a RealDictCursor, closed and returned on exit.
+    A `name` makes it a server-side cursor that fetches rows in batches of
+    cur.itersize while iterated.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor(name=name, cursor_factory=TimedDictCursor)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+def db_pool_stats():
+    with db_pool["lock"]:
+        stats = dict(db_pool["stats"])
+    pool = db_pool["pool"]
+    stats.update({
+        "min_size": PGPOOL_MIN,
+        "max_size": PGPOOL_MAX,
+        "idle": len(pool._pool) if pool is not None else 0,
+        "open": len(pool._pool) + len(pool._used) if pool is not None else 0
+    })
+    return stats
+
 app = Flask(__name__)
 CORS(app)  
 
-cache = {
-    "data": None,
-    "timestamp": 0
-}
+class LocalCacheBackend:
+    """Per-process cache backend: a dict plus a lock per key."""
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._guard = threading.Lock()
 
-# Round lookup cache (1 hr)
-round_cache = {
-    "season": None,
-    "round": None,
-    "timestamp": 0
-}
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, entry):
+        self._entries[key] = entry
+
+    def acquire(self, key, timeout):
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        acquired = lock.acquire(timeout=timeout) if timeout > 0 else lock.acquire(blocking=False)
+        return lock if acquired else None
+
+    def release(self, handle):
+        handle.release()
+
+class FileCacheBackend:
+    """
+    Cache backend shared by every worker process on the host: one JSON file
+    per key, replaced atomically, with an flock'd lock file per key for
+    single-flight refreshes.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', key) + suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        path = self._path(key, '.json')
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def acquire(self, key, timeout):
+        fd = os.open(self._path(key, '.lock'), os.O_CREAT | os.O_RDWR)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    os.close(fd)
+                    return None
+                time.sleep(0.05)
+
+    def release(self, handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        os.close(handle)
+
+class SharedCache:
+    """
+    TTL cache for upstream data with single-flight refresh and
+    stale-while-revalidate: a fresh entry is returned as is; a stale one is
+    returned immediately while one caller (across all workers, with a shared
+    backend) refreshes it in the background; only a cold or expired key makes
+    the caller wait, and then only one caller fetches while the rest wait for it.
+    """
+    def __init__(self, backend, lock_timeout=10, retry_after=30):
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        self.retry_after = retry_after  # seconds to wait before retrying a failed refresh
+        self._failed_at = {}
+
+    def get(self, key, ttl, fetch, max_stale=86400):
+        entry = self.backend.get(key)
+        age = time.time() - entry["stored_at"] if entry else None
+        if entry and age < ttl:
+            CACHE_LOOKUPS.labels('upstream', 'hit').inc()
+            return entry["value"]
+
+        if entry and age < ttl + max_stale:
+            CACHE_LOOKUPS.labels('upstream', 'stale').inc()
+            if time.time() - self._failed_at.get(key, 0) >= self.retry_after:
+                handle = self.backend.acquire(key, timeout=0)
+                if handle is not None:
+                    threading.Thread(target=self._refresh, args=(key, fetch, handle), daemon=True).start()
+            return entry["value"]
+
+        CACHE_LOOKUPS.labels('upstream', 'miss').inc()
+        handle = self.backend.acquire(key, timeout=self.lock_timeout)
+        try:
+            # Another worker may have refreshed it while we waited for the lock
+            entry = self.backend.get(key)
+            if entry and time.time() - entry["stored_at"] < ttl:
+                return entry["value"]
+            return self.put(key, fetch())
+        finally:
+            if handle is not None:
+                self.backend.release(handle)
+
+    def put(self, key, value):
+        self.backend.set(key, {"value": value, "stored_at": time.time()})
+        self._failed_at.pop(key, None)
+        return value
+
+    def _refresh(self, key, fetch, handle):
+        try:
+            self.put(key, fetch())
+        except Exception as e:
+            self._failed_at[key] = time.time()
+            logger.warning("Error refreshing %s: %s", key, e)
+        finally:
+            self.backend.release(handle)
+
+# nrl.com lookups (current round, latest results), shared by all workers unless
+# UPSTREAM_CACHE_BACKEND=memory
+UPSTREAM_CACHE_DIR = os.environ.get('UPSTREAM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'bsmachine_upstream_cache'))
+upstream_cache = SharedCache(
+    LocalCacheBackend() if os.environ.get('UPSTREAM_CACHE_BACKEND') == 'memory'
+    else FileCacheBackend(UPSTREAM_CACHE_DIR)
+)
 
 # map NRL nicknames to your site’s naming convention
 TEAM_NAME_MAP = {
@@ -51,89 +410,373 @@ def extract_round(match):
             return int(m.group(1))
     return None
 
-def get_current_season_and_round():
-    now = time.time()
-    cache_duration = 3600  # 1 hour
+NRL_BASE_URL = os.environ.get('NRL_BASE_URL', 'https://www.nrl.com')
+NRL_COMPETITION = 111
 
-    # Use cached round if still valid
-    if round_cache["season"] and (now - round_cache["timestamp"]) < cache_duration:
-        print(f"[CACHE] Returning cached round: {round_cache['season']}, {round_cache['round']}")
-        return round_cache["season"], round_cache["round"]
+class NrlDrawClient:
+    """
+    HTTP client for nrl.com draw data: one keep-alive Session, request
+    timeouts, and conditional GETs (ETag / Last-Modified) that reuse the last
+    parsed payload for a URL when the server answers 304.
+    """
+    def __init__(self, base_url=NRL_BASE_URL, timeout=10, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        self._validators = {}  # url -> (etag, last_modified, data)
+        self._lock = threading.Lock()
+        self.not_modified = 0
 
-    try:
-        url = "https://www.nrl.com/draw/data"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        res = requests.get(url, headers=headers)
+    def get_json(self, path, params=None):
+        url = requests.Request('GET', self.base_url + path, params=params).prepare().url
+        with self._lock:
+            etag, last_modified, cached = self._validators.get(url, (None, None, None))
+        headers = {}
+        if cached is not None:
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            res = self.session.get(url, headers=headers, timeout=self.timeout)
+            status = str(res.status_code)
+        finally:
+            NRL_FETCH_SECONDS.labels(path, status).observe(time.perf_counter() - start)
+        if res.status_code == 304 and cached is not None:
+            self.not_modified += 1
+            return cached
         res.raise_for_status()
         data = res.json()
+        with self._lock:
+            self._validators[url] = (res.headers.get('ETag'), res.headers.get('Last-Modified'), data)
+        return data
 
-        fixtures = data.get("fixtures", [])
-        current_year = datetime.now().year
-        selected = data.get("selectedRoundId", 1)
-        fixtures = data.get("fixtures", [])
+nrl_client = NrlDrawClient()
 
-        any_played = any(
-            (m.get("homeTeam", {}).get("score") is not None or
-             m.get("awayTeam", {}).get("score") is not None)
-            for m in fixtures
-        )
+def parse_current_round(data):
+    current_year = datetime.now().year
+    selected = data.get("selectedRoundId", 1)
+    fixtures = data.get("fixtures", [])
 
-        current_round = selected if any_played else max(1, selected - 1)
-        
-        round_cache["season"] = current_year
-        round_cache["round"] = current_round
-        round_cache["timestamp"] = now
+    any_played = any(
+        (m.get("homeTeam", {}).get("score") is not None or
+         m.get("awayTeam", {}).get("score") is not None)
+        for m in fixtures
+    )
 
-        print(f"[DEBUG] Returning current round: {current_year}, {current_round}")
-        
-        return current_year, current_round
-    
+    current_round = selected if any_played else max(1, selected - 1)
+    return [current_year, current_round]
+
+def parse_fixture_results(season, round_num, data):
+    """
+    One row per fixture in a round's draw data for ingest_results:
+    (season, round, home, away, home_score, away_score, is_finished, kickoff, venue),
+    with team names mapped to ours. Scores are None until the match starts.
+    """
+    rows = []
+    for match in data.get("fixtures", []):
+        home_team = TEAM_NAME_MAP.get(match['homeTeam']['nickName'], match['homeTeam']['nickName'])
+        away_team = TEAM_NAME_MAP.get(match['awayTeam']['nickName'], match['awayTeam']['nickName'])
+        rows.append((
+            season, round_num, home_team, away_team,
+            match['homeTeam'].get('score'), match['awayTeam'].get('score'),
+            match.get('matchMode') == 'Post',
+            match.get('clock', {}).get('kickOffTimeLong'),
+            match.get('venue')
+        ))
+    return rows
+
+def ingest_results(cur, rows):
+    """
+    Bring `matches` in line with parsed draw rows. One query finds the
+    fixtures whose score or finished flag differ from the database (or that
+    have no row yet); only those are written, with one bulk UPDATE and one
+    bulk INSERT, so an unchanged draw writes nothing and fires no triggers.
+    Fixtures whose season, round or teams aren't in the database are skipped.
+    Returns the ids of the matches written.
+    """
+    if not rows:
+        return []
+    changed = execute_values(cur, """
+        SELECT m.id AS match_id, r.id AS round_id, th.id AS home_team_id, ta.id AS away_team_id,
+               i.home_score, i.away_score, i.is_finished, i.kickoff, i.venue
+        FROM (VALUES %s) AS i (season, round_number, home_team, away_team,
+                               home_score, away_score, is_finished, kickoff, venue)
+        JOIN seasons s ON s.year = i.season
+        JOIN rounds r ON r.season_id = s.id AND r.round_number = i.round_number
+        JOIN teams th ON th.name = i.home_team
+        JOIN teams ta ON ta.name = i.away_team
+        LEFT JOIN matches m
+            ON m.round_id = r.id AND m.home_team_id = th.id AND m.away_team_id = ta.id
+        WHERE m.id IS NULL
+           OR (m.home_score, m.away_score, m.is_finished)
+              IS DISTINCT FROM (i.home_score, i.away_score, i.is_finished)
+    """, rows, template="(%s::int, %s::int, %s, %s, %s::int, %s::int, %s::boolean, %s::timestamptz, %s)",
+        fetch=True)
+
+    updates = [row for row in changed if row['match_id'] is not None]
+    inserts = [row for row in changed if row['match_id'] is None and row['kickoff'] is not None]
+    written = []
+    if updates:
+        written += [row['id'] for row in execute_values(cur, """
+            UPDATE matches m
+            SET home_score = v.home_score, away_score = v.away_score, is_finished = v.is_finished
+            FROM (VALUES %s) AS v (id, home_score, away_score, is_finished)
+            WHERE m.id = v.id
+            RETURNING m.id
+        """, [
+            (row['match_id'], row['home_score'], row['away_score'], row['is_finished']) for row in updates
+        ], template="(%s, %s::int, %s::int, %s::boolean)", fetch=True)]
+    if inserts:
+        written += [row['id'] for row in execute_values(cur, """
+            INSERT INTO matches (round_id, date, home_team_id, away_team_id, venue,
+                                 is_finished, home_score, away_score)
+            VALUES %s
+            RETURNING id
+        """, [
+            (row['round_id'], row['kickoff'], row['home_team_id'], row['away_team_id'], row['venue'],
+             row['is_finished'], row['home_score'], row['away_score'])
+            for row in inserts
+        ], fetch=True)]
+    return written
+
+def ingest_round_draw(season, round_num, draw):
+    """
+    Persist a round's results and drop this worker's cached responses that
+    read `matches`. Other workers are told by the table_changed trigger, and
+    newly finished matches are queued for the try-rate refresh by theirs.
+    """
+    with db_cursor() as cur:
+        written = ingest_results(cur, parse_fixture_results(season, round_num, draw))
+    if written:
+        bump_table_version('matches')
+        logger.info("Ingested %d changed fixtures for %s round %s", len(written), season, round_num)
+    return written
+
+def fetch_round_draw(season, round_num, default_draw=None):
+    """
+    Draw data for a round. The unparameterised draw/data response already is
+    the selected round, so reuse it instead of fetching the same round twice.
+    """
+    if (default_draw is not None
+            and default_draw.get("selectedRoundId") == round_num
+            and default_draw.get("selectedCompetitionId", NRL_COMPETITION) == NRL_COMPETITION
+            and default_draw.get("selectedSeasonId", season) == season):
+        return default_draw
+    return nrl_client.get_json('/draw/data', params={'competition': NRL_COMPETITION, 'season': season, 'round': round_num})
+
+def fetch_current_season_and_round():
+    season, round_num = parse_current_round(nrl_client.get_json('/draw/data'))
+    logger.debug("Fetched current round: %s, %s", season, round_num)
+    return [season, round_num]
+
+def get_current_season_and_round():
+    try:
+        season, round_num = upstream_cache.get('current_round', 3600, fetch_current_season_and_round)  # 1 hour
+        return season, round_num
     except Exception as e:
-        print(f"Error getting current round: {e}")
+        logger.warning("Error getting current round: %s", e)
         return datetime.now().year, 1  # fallback
+
+def in_live_window(fixtures, now=None, before=timedelta(minutes=15), after=timedelta(hours=3)):
+    """True if a fixture is live, or kicks off within `before` / kicked off within `after`."""
+    now = now or datetime.now(timezone.utc)
+    for match in fixtures:
+        if match.get("matchMode") == "Live":
+            return True
+        kickoff = match.get("clock", {}).get("kickOffTimeLong")
+        if not kickoff:
+            continue
+        try:
+            kickoff = datetime.fromisoformat(kickoff.replace('Z', '+00:00'))
+        except ValueError:
+            continue
+        if kickoff.tzinfo is None:
+            kickoff = kickoff.replace(tzinfo=timezone.utc)
+        if kickoff - before <= now <= kickoff + after:
+            return True
+    return False
+
+class NrlDrawPoller:
+    """
+    Keeps the shared 'current_round' cache entry warm and ingests the current
+    round's scores into `matches` from a background thread, so routes never
+    wait on nrl.com. Polls every
+    `live_interval` seconds around matches and `idle_interval` otherwise,
+    backing off exponentially (up to `max_interval`) after errors. Only the
+    worker holding the 'nrl_poller' backend lock polls; the others stand by
+    and take over if it exits.
+    """
+    def __init__(self, client, cache, live_interval=30, idle_interval=600, max_interval=1800):
+        self.client = client
+        self.cache = cache
+        self.live_interval = live_interval
+        self.idle_interval = idle_interval
+        self.max_interval = max_interval
+        self.failures = 0
+        self.last_polled = None
+
+    def poll_once(self):
+        """Fetch, publish and return the number of seconds until the next poll."""
+        try:
+            default_draw = self.client.get_json('/draw/data')
+            season, round_num = parse_current_round(default_draw)
+            round_draw = fetch_round_draw(season, round_num, default_draw)
+        except Exception as e:
+            logger.warning("Error polling NRL draw: %s", e)
+            return self.backoff()
+
+        self.cache.put('current_round', [season, round_num])
+        try:
+            ingest_round_draw(season, round_num, round_draw)
+        except Exception as e:
+            logger.warning("Error ingesting NRL results: %s", e)
+        self.failures = 0
+        self.last_polled = time.time()
+        live = in_live_window(round_draw.get("fixtures", []))
+        return self.live_interval if live else self.idle_interval
+
+    def backoff(self):
+        self.failures += 1
+        return min(self.max_interval, self.live_interval * 2 ** self.failures)
+
+    def run(self):
+        while True:
+            try:
+                handle = self.cache.backend.acquire('nrl_poller', timeout=0)
+            except Exception as e:
+                logger.warning("Error acquiring NRL poller lock: %s", e)
+                handle = None
+            if handle is None:
+                time.sleep(self.live_interval)  # another worker is polling
+                continue
+            try:
+                while True:
+                    # Anything poll_once doesn't handle (e.g. a full disk under
+                    # the cache) must not end the thread for good
+                    try:
+                        interval = self.poll_once()
+                    except Exception as e:
+                        logger.exception("NRL poller error: %s", e)
+                        interval = self.backoff()
+                    time.sleep(interval)
+            finally:
+                self.cache.backend.release(handle)
+
+NRL_POLLER = os.environ.get('NRL_POLLER', '1') != '0'
+nrl_poller = NrlDrawPoller(
+    nrl_client, upstream_cache,
+    live_interval=float(os.environ.get('NRL_POLL_LIVE_INTERVAL', 30)),
+    idle_interval=float(os.environ.get('NRL_POLL_IDLE_INTERVAL', 600))
+)
+nrl_poller_state = {"pid": None, "lock": threading.Lock()}
+
+@app.before_request
+def start_nrl_poller():
+    if NRL_POLLER and nrl_poller_state["pid"] != os.getpid():
+        with nrl_poller_state["lock"]:
+            if nrl_poller_state["pid"] != os.getpid():
+                threading.Thread(target=nrl_poller.run, daemon=True).start()
+                nrl_poller_state["pid"] = os.getpid()
     
+# Highest team try count accepted for pricing. Binomial tables are O(n^2) and
+# C(n, k) overflows float64 from n ~ 1030, so larger requests are refused.
+SGM_MAX_TRY_COUNT = int(os.environ.get('SGM_MAX_TRY_COUNT', 200))
+
+def valid_try_dist(try_dist):
+    """True if try_dist maps integer try counts up to SGM_MAX_TRY_COUNT to finite, non-negative probabilities."""
+    if not isinstance(try_dist, dict):
+        return False
+    try:
+        return all(
+            int(k) <= SGM_MAX_TRY_COUNT and np.isfinite(float(v)) and float(v) >= 0
+            for k, v in try_dist.items()
+        )
+    except (TypeError, ValueError):
+        return False
+
+def valid_legs(player_probs, min_tries):
+    """
+    True if player_probs and min_tries are equal-length lists of probabilities
+    in [0, 1] summing to at most 1 (one team's tries are shared between its
+    players) and non-negative integer try counts.
+    """
+    if not isinstance(player_probs, list) or not isinstance(min_tries, list) or len(player_probs) != len(min_tries):
+        return False
+    numeric = all(isinstance(p, (int, float)) and not isinstance(p, bool) for p in player_probs)
+    counts = all(isinstance(m, int) and not isinstance(m, bool) and m >= 0 for m in min_tries)
+    return (numeric and counts and all(0 <= p <= 1 for p in player_probs)
+            and sum(player_probs) <= 1 + 1e-9)
+
+@lru_cache(maxsize=32)
+def binomial_tables(n_max):
+    """
+    Cached helpers for convolving vectors over 0..n_max tries:
+    binom[n, k] = C(n, k) and shift[n, k] = n - k (or n_max + 1 where k > n,
+    which indexes the zero padding appended to the vector being shifted).
+    """
+    if n_max > SGM_MAX_TRY_COUNT:
+        raise ValueError(f"{n_max} tries exceeds SGM_MAX_TRY_COUNT={SGM_MAX_TRY_COUNT}")
+    n = np.arange(n_max + 1)
+    binom = comb(n[:, None], n[None, :])  # zero where k > n
+    shift = n[:, None] - n[None, :]
+    shift[shift < 0] = n_max + 1
+    binom.setflags(write=False)
+    shift.setflags(write=False)
+    return binom, shift
+
+def binomial_convolve(a, b):
+    """
+    Combine two per-try-count probability vectors for disjoint groups of players.
+    a[n] and b[n] are the chances each group's constraint holds when it receives
+    exactly n tries (tries are assigned independently, so each allocation splits
+    by the binomial coefficient). Returns c with c[n] = sum_k C(n,k) a[k] b[n-k].
+    """
+    binom, shift = binomial_tables(len(a) - 1)
+    padded = np.append(b, 0.0)
+    return (binom * padded[shift]) @ a
+
+def truncated_leg(counts, p, m):
+    """Generating-function series for one player: p**x where x >= m, else 0."""
+    return np.where(counts >= m, np.power(float(p), counts), 0.0)
+
+def min_tries_probabilities(n_max, probs, mins):
+    """
+    Vector of P(X1 >= mins[0], ..., XK >= mins[K-1] | n tries) for every
+    n in 0..n_max, where (X1,...,XK, X_other) ~ Multinomial(n, [p1,...,pK, p_other]).
+    Uses an exponential generating function over per-player truncated counts:
+    each player contributes p_i**x for x >= mins[i], 'other' contributes
+    p_other**x, and the players are folded in with binomial convolutions.
+    The truncated series don't depend on n, so one O(K * n_max^2) sweep
+    answers every try count at once.
+    """
+    counts = np.arange(n_max + 1)
+    p_other = 1.0 - sum(probs)
+    result = np.power(p_other, counts, dtype=float)
+    for p, m in zip(probs, mins):
+        result = binomial_convolve(result, truncated_leg(counts, p, m))
+    return result
+
 def multinomial_at_least(n, probs, mins):
     """
     Compute P(X1 >= mins[0], X2 >= mins[1], ..., XK >= mins[K-1]) 
     where (X1,...,XK, X_other) ~ Multinomial(n, [p1,...,pK, p_other]).
-    Uses inclusion-exclusion principle.
     """
-    K = len(probs)
-    p_other = 1.0 - sum(probs)
-    all_probs = list(probs) + [p_other]
-    all_mins = list(mins) + [0] # 'other' has no lower limit
-    
-    total = 0.0
-    subsets = []
-    for mask in range(1, 1 << K):
-        subset = [i for i in range(K) if (mask & (1 << i))]
-        subsets.append(subset)
-
-    for subset in subsets:
-        sign = (-1) ** (len(subset) + 1)
-        upper_limits = [mins[i] - 1 if i in subset else n for i in range(K)]
-        allocs = []
-        def gen(idx, remaining, cur):
-            if idx == K:
-                cur_other = remaining
-                if cur_other >= 0:
-                    allocs.append(cur + [cur_other])
-                return
-            max_k = min(upper_limits[idx], remaining)
-            for x in range(0, max_k + 1):
-                gen(idx + 1, remaining - x, cur + [x])
-        gen(0, n, [])
-        prob = 0.0
-        for alloc in allocs:
-            multinom = factorial(n)
-            for x in alloc:
-                multinom /= factorial(x)
-            p = 1.0
-            for i, x in enumerate(alloc):
-                p *= all_probs[i] ** x
-            prob += multinom * p
-        total += sign * prob
-    return 1.0 - total
+    return float(min_tries_probabilities(n, probs, mins)[n])
+
+def try_dist_vector(try_dist):
+    """
+    Convert a {n_tries: prob} dict (keys may be strings) into a dense
+    array indexed by try count. Negative counts are ignored.
+    """
+    counts = {int(k): float(v) for k, v in try_dist.items() if int(k) >= 0}
+    vec = np.zeros(max(counts, default=-1) + 1)
+    for n_tries, p_n in counts.items():
+        vec[n_tries] += p_n
+    return vec
 
 def joint_min_tries_probability(try_dist, player_probs, min_tries):
     """
@@ -142,69 +785,762 @@ def joint_min_tries_probability(try_dist, player_probs, min_tries):
     min_tries: list of minimum required tries for each selected player
     Returns: joint probability
     """
-    result = 0.0
-    for n_tries_str, p_n in try_dist.items():
-        n_tries = int(n_tries_str)
-        if n_tries < sum(min_tries):
-            continue
-        joint_prob = multinomial_at_least(n_tries, player_probs, min_tries)
-        result += p_n * joint_prob
-    return result
+    dist = try_dist_vector(try_dist)
+    if dist.size == 0:
+        return 0.0
+    cond = min_tries_probabilities(dist.size - 1, player_probs, min_tries)
+    return float(dist @ cond)
 
-@app.route('/latest-results')
-def latest_results():
-    now = time.time()
-    cache_duration = 300  # seconds = 5 minutes
-
-    # Use cache if still valid
-    if cache["data"] and (now - cache["timestamp"]) < cache_duration:
-        return app.response_class(
-            response=json.dumps(cache["data"]),
-            status=200,
-            mimetype='application/json'
-        )
+def canonical_legs(player_probs, min_tries):
+    """
+    Order-independent key for a leg combination: sorted (prob, min_tries) pairs.
+    The multinomial is symmetric in its players, so permuted legs price the same.
+    """
+    return tuple(sorted(zip((float(p) for p in player_probs), (int(m) for m in min_tries))))
 
-    # Otherwise fetch fresh data
-    # Get current season and round
-    season, round_num = get_current_season_and_round()
-    url = f'https://www.nrl.com/draw/data?competition=111&season={season}&round={round_num}'
-    #url = f'https://www.nrl.com/draw/data?competition=111&season=2025&round=15'
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    res = requests.get(url, headers=headers)
-    data = res.json()
+def price_sgm_combinations(try_dist, combinations):
+    """
+    Price many (player_probs, min_tries) combinations against one try distribution.
+    Identical and permuted combinations are priced once, and the convolved leg
+    vectors are memoised by sorted-leg prefix so combinations sharing legs reuse
+    each other's work. The 'other' share depends on every leg, so it is folded
+    in last. Returns probabilities in the order the combinations were given.
+    """
+    dist = try_dist_vector(try_dist)
+    if dist.size == 0:
+        return [0.0 for _ in combinations]
+    counts = np.arange(dist.size)
+    empty = np.zeros(dist.size)
+    empty[0] = 1.0  # identity for binomial_convolve
+    prefixes = {(): empty}
+    priced = {}
+
+    def legs_vector(legs):
+        if legs not in prefixes:
+            p, m = legs[-1]
+            prefixes[legs] = binomial_convolve(legs_vector(legs[:-1]), truncated_leg(counts, p, m))
+        return prefixes[legs]
 
     results = []
-    for match in data.get("fixtures", []):
-        home_team = TEAM_NAME_MAP.get(match['homeTeam']['nickName'], match['homeTeam']['nickName'])
-        away_team = TEAM_NAME_MAP.get(match['awayTeam']['nickName'], match['awayTeam']['nickName'])
-        home_score = match['homeTeam'].get('score')
-        away_score = match['awayTeam'].get('score')
-
-        if home_score is not None and away_score is not None:
-            winner = home_score > away_score and home_team or away_team
-            results.append({
-                'home': home_team,
-                'away': away_team,
-                'home_score': home_score,
-                'away_score': away_score,
-                'winner': winner
-            })
-
-    # Save to cache
-    cache["data"] = results
-    cache["timestamp"] = now
+    for player_probs, min_tries in combinations:
+        legs = canonical_legs(player_probs, min_tries)
+        if legs not in priced:
+            p_other = 1.0 - sum(p for p, _ in legs)
+            cond = binomial_convolve(legs_vector(legs), np.power(p_other, counts, dtype=float))
+            priced[legs] = float(dist @ cond)
+        results.append(priced[legs])
+    return results
+
+# Monte Carlo pricing (mode=simulate) for selections too large to price exactly
+SGM_SIM_TARGET_SE = float(os.environ.get('SGM_SIM_TARGET_SE', 0.001))
+SGM_SIM_MAX_SAMPLES = int(os.environ.get('SGM_SIM_MAX_SAMPLES', 1_000_000))
+SGM_SIM_BATCH_SIZE = int(os.environ.get('SGM_SIM_BATCH_SIZE', 50_000))
+# Every sample holds one int64 count per leg plus 'other', so batches shrink
+# and the sample budget drops as legs are added: memory and time stay bounded.
+SGM_SIM_BATCH_CELLS = int(os.environ.get('SGM_SIM_BATCH_CELLS', 2_000_000))  # 16 MB of counts
+SGM_SIM_MAX_CELLS = int(os.environ.get('SGM_SIM_MAX_CELLS', 50_000_000))
+
+def simulate_min_tries_probability(try_dist, player_probs, min_tries, target_se=SGM_SIM_TARGET_SE,
+                                   max_samples=SGM_SIM_MAX_SAMPLES, batch_size=SGM_SIM_BATCH_SIZE, seed=0):
+    """
+    Monte Carlo estimate of joint_min_tries_probability. Each batch draws team
+    try counts from try_dist and splits them multinomially across the players
+    and 'other'; sampling stops once the standard error is within target_se
+    or max_samples have been drawn. Batches are cut to SGM_SIM_BATCH_CELLS and
+    samples to SGM_SIM_MAX_CELLS counts, so the cost is bounded whatever the
+    leg count.
+    The standard error is the Agresti-Coull one (two pseudo-hits and two
+    pseudo-misses), which stays honest for rare selections where few or no
+    samples hit. Returns (probability, standard_error, samples).
+    """
+    dist = try_dist_vector(try_dist)
+    total = dist.sum()
+    if dist.size == 0 or total <= 0:
+        return 0.0, 0.0, 0
+    pvals = np.append(np.asarray(player_probs, dtype=float), max(0.0, 1.0 - sum(player_probs)))
+    mins = np.asarray(min_tries)
+    cells = pvals.size
+    batch_size = max(1, min(batch_size, SGM_SIM_BATCH_CELLS // cells))
+    max_samples = max(1, min(max_samples, SGM_SIM_MAX_CELLS // cells))
+    rng = np.random.default_rng(seed)
+    hits = samples = 0
+    while samples < max_samples:
+        size = min(batch_size, max_samples - samples)
+        n = rng.choice(dist.size, size=size, p=dist / total)
+        counts = rng.multinomial(n, pvals)
+        hits += int(np.count_nonzero((counts[:, :-1] >= mins).all(axis=1)))
+        samples += size
+        if total * agresti_coull_se(hits, samples) <= target_se:
+            break
+    # try_dist may not sum to 1; scale like the exact path's dist @ cond
+    return float(total * hits / samples), float(total * agresti_coull_se(hits, samples)), samples
+
+def agresti_coull_se(hits, samples):
+    """
+    Standard error of a hit rate from the Agresti-Coull interval. Unlike the
+    plug-in sqrt(p(1-p)/n) it is never 0, even with no hits at all.
+    """
+    adjusted = samples + 4
+    p = (hits + 2) / adjusted
+    return np.sqrt(p * (1 - p) / adjusted)
+
+def sgm_cache_key(try_dist, player_probs, min_tries, quantum=1e-9):
+    """
+    Canonical cache key for an SGM price: the try distribution as sorted
+    (n_tries, prob) pairs plus the sorted (prob, min_tries) legs, with every
+    float snapped to `quantum` so tiny serialisation differences still match.
+    """
+    digits = max(0, int(round(-np.log10(quantum))))
+    dist = sorted((int(k), round(float(v), digits)) for k, v in try_dist.items())
+    legs = sorted((round(p, digits), m) for p, m in canonical_legs(player_probs, min_tries))
+    return hashlib.sha1(repr((dist, legs)).encode()).hexdigest()
+
+class SharedPriceStore:
+    """
+    Price store shared by every gunicorn worker on the host. Backed by an
+    SQLite file, which lives in shared memory when the path is under /dev/shm.
+    """
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prices (
+                    key TEXT PRIMARY KEY,
+                    value REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM prices WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO prices (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + self.ttl)
+        )
+        self._writes += 1
+        if self._writes % 256 == 0:
+            self.prune()
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM prices WHERE expires_at <= ?", (time.time(),))
+        conn.execute("""
+            DELETE FROM prices WHERE key IN (
+                SELECT key FROM prices ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+class PriceCache:
+    """
+    In-process LRU cache for SGM prices with a TTL and a size bound, optionally
+    backed by a SharedPriceStore so a price computed by one worker is reused
+    by the others.
+    """
+    def __init__(self, max_entries=4096, ttl=900, shared=None, name='price'):
+        self.name = name  # cache label in CACHE_LOOKUPS
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    CACHE_LOOKUPS.labels(self.name, 'hit').inc()
+                    return entry[0]
+                del self._entries[key]
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                CACHE_LOOKUPS.labels(self.name, 'shared_hit').inc()
+                return value
+        with self._lock:
+            self.misses += 1
+        CACHE_LOOKUPS.labels(self.name, 'miss').inc()
+        return None
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except sqlite3.Error:
+                pass  # the shared store is best effort; the local copy still serves
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                "shared": self.shared is not None
+            }
+
+# SGM price cache; set SGM_CACHE_SHARED_PATH (e.g. /dev/shm/sgm_prices.db) to share across workers
+SGM_CACHE_SIZE = int(os.environ.get('SGM_CACHE_SIZE', 4096))
+SGM_CACHE_TTL = float(os.environ.get('SGM_CACHE_TTL', 900))
+SGM_CACHE_SHARED_PATH = os.environ.get('SGM_CACHE_SHARED_PATH')
+sgm_price_cache = PriceCache(
+    max_entries=SGM_CACHE_SIZE,
+    ttl=SGM_CACHE_TTL,
+    shared=SharedPriceStore(SGM_CACHE_SHARED_PATH, SGM_CACHE_SIZE * 4, SGM_CACHE_TTL) if SGM_CACHE_SHARED_PATH else None,
+    name='sgm_price'
+)
+
+# Worker processes for SGM pricing, so heavy selections never hold a web
+# worker (or a gevent worker's event loop). SGM_PRICING_PROCESSES=0 prices
+# inline, where only the up-front work limit applies. Every web worker gets its
+# own pool, and each process is a full interpreter with numpy, scipy and this
+# module loaded: about 130 MiB RSS apiece (see benchmarks/serve.py). So the
+# pool defaults to one process, and only under gevent, where a blocked worker
+# stalls every request on it; it starts on the first selection estimated
+# above SGM_INLINE_WORK, and lighter ones (around a millisecond) price inline.
+SGM_PRICING_PROCESSES = int(os.environ.get('SGM_PRICING_PROCESSES', 1 if gevent_active() else 0))
+SGM_INLINE_WORK = float(os.environ.get('SGM_INLINE_WORK', 1e6))  # multiply-adds, see pricing_work
+SGM_PRICING_TIMEOUT = float(os.environ.get('SGM_PRICING_TIMEOUT', 5))  # seconds per request
+SGM_MAX_WORK = float(os.environ.get('SGM_MAX_WORK', 1e8))  # multiply-adds, see pricing_work
+pricing_pool = {"executor": None, "pid": None, "lock": threading.Lock()}
+
+class PricingTooLarge(Exception):
+    pass
+
+class PricingUnavailable(Exception):
+    pass
+
+@app.errorhandler(PricingTooLarge)
+def pricing_too_large(e):
+    return jsonify({"error": "Selection too large to price", "detail": str(e)}), 422
+
+@app.errorhandler(PricingUnavailable)
+def pricing_unavailable(e):
+    response = jsonify({"error": "Pricing unavailable", "detail": str(e)})
+    response.headers['Retry-After'] = str(max(1, int(SGM_PRICING_TIMEOUT)))
+    return response, 503
+
+def max_tries(try_dist):
+    return max((int(k) for k in try_dist), default=0)
+
+def pricing_work(try_dist, leg_counts):
+    """
+    Rough cost of pricing: each leg is one (N+1)^2 binomial convolution,
+    where N is the highest try count in the distribution.
+    """
+    return try_count_work(max_tries(try_dist), leg_counts)
+
+def try_count_work(n_max, leg_counts):
+    """pricing_work for distributions running to n_max tries, such as a match's SGM bins."""
+    if n_max > SGM_MAX_TRY_COUNT:
+        SGM_REJECTED.labels('too_large').inc()
+        raise PricingTooLarge(f"{n_max} tries exceeds the limit of {SGM_MAX_TRY_COUNT}")
+    return (n_max + 1) ** 2 * (sum(leg_counts) + len(leg_counts))
+
+def observe_sgm_selection(mode, n_max, leg_counts, evaluated, unit='combinations'):
+    """Engine stats for one priced request: K per combination, n range and work done."""
+    for legs in leg_counts:
+        SGM_LEGS.labels(mode).observe(legs)
+    SGM_MAX_TRIES.labels(mode).observe(n_max)
+    SGM_EVALUATED.labels(mode, unit).inc(evaluated)
+
+def check_pricing_work(work):
+    if work > SGM_MAX_WORK:
+        SGM_REJECTED.labels('too_large').inc()
+        raise PricingTooLarge(
+            f"estimated work {work:.3g} exceeds the limit of {SGM_MAX_WORK:.3g}; try mode=simulate"
+        )
+
+def get_pricing_executor():
+    if SGM_PRICING_PROCESSES <= 0:
+        return None
+    if pricing_pool["pid"] != os.getpid() or pricing_pool["executor"] is None:
+        with pricing_pool["lock"]:
+            if pricing_pool["pid"] != os.getpid() or pricing_pool["executor"] is None:
+                # spawn, not fork: children shouldn't inherit the gevent hub or worker threads
+                executor = ProcessPoolExecutor(
+                    max_workers=SGM_PRICING_PROCESSES,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=importlib.import_module,
+                    initargs=(__name__,)
+                )
+                # Wait for the workers to import this module so start-up isn't charged to a request's budget
+                wait_for_future(executor.submit(abs, 0), None)
+                pricing_pool["executor"] = executor
+                pricing_pool["pid"] = os.getpid()
+    return pricing_pool["executor"]
+
+def reset_pricing_executor(executor):
+    """
+    Kill a pool whose worker is stuck on an abandoned job. A running job can't
+    be cancelled on its own, so its processes are terminated and the next
+    request starts a fresh pool; other jobs on it fail with PricingUnavailable.
+    """
+    with pricing_pool["lock"]:
+        if pricing_pool["executor"] is executor:
+            pricing_pool["executor"] = None
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def client_disconnected():
+    """True if the client behind this request has closed its connection."""
+    sock = request.environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+def wait_for_future(future, timeout):
+    """
+    concurrent.futures.wait for one future. Under gevent the future's
+    condition is a patched lock that a native thread can't block on (it
+    raises LoopExit), so poll it from this greenlet instead, backing off from
+    1ms to 20ms between checks.
+    """
+    if not gevent_active():
+        return wait_futures([future], timeout)
+    import gevent
+    deadline = None if timeout is None else time.time() + timeout
+    interval = 0.001
+    while not future.done():
+        if deadline is not None and time.time() >= deadline:
+            return set(), {future}
+        gevent.sleep(interval if deadline is None else min(interval, max(0.0, deadline - time.time())))
+        interval = min(interval * 2, 0.02)
+    return {future}, set()
+
+def run_pricing(fn, *args, work=None):
+    """
+    Run a pricing function via price_in_pool, timed per engine in
+    SGM_PRICING_SECONDS. Calls whose estimated `work` is within
+    SGM_INLINE_WORK run inline, so light traffic never starts the pool.
+    """
+    start = time.perf_counter()
+    try:
+        if work is not None and work <= SGM_INLINE_WORK:
+            return fn(*args)
+        return price_in_pool(fn, *args)
+    finally:
+        SGM_PRICING_SECONDS.labels(fn.__name__).observe(time.perf_counter() - start)
+
+def price_in_pool(fn, *args):
+    """
+    Run a pricing function in the pricing pool within SGM_PRICING_TIMEOUT.
+    The job is abandoned, and its worker killed if already running, when the
+    budget runs out or the client disconnects; either raises PricingUnavailable.
+    Under gevent the waits yield to other greenlets.
+    """
+    executor = get_pricing_executor()
+    if executor is None:
+        return fn(*args)
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        reset_pricing_executor(executor)
+        SGM_REJECTED.labels('pool_restarted').inc()
+        raise PricingUnavailable("pricing pool restarted, try again")
+
+    deadline = time.time() + SGM_PRICING_TIMEOUT
+    while True:
+        done, _ = wait_for_future(future, min(0.25, max(0.0, deadline - time.time())))
+        if done:
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                reset_pricing_executor(executor)
+                SGM_REJECTED.labels('pool_restarted').inc()
+                raise PricingUnavailable("pricing pool restarted, try again")
+        if time.time() >= deadline:
+            SGM_REJECTED.labels('timeout').inc()
+            reason = f"exceeded the {SGM_PRICING_TIMEOUT:g}s compute budget"
+        elif client_disconnected():
+            SGM_REJECTED.labels('disconnected').inc()
+            reason = "client disconnected"
+        else:
+            continue
+        if not future.cancel():
+            reset_pricing_executor(executor)
+        raise PricingUnavailable(reason)
+
+# Postgres LISTEN/NOTIFY: channel -> handlers called with the payload, or None
+# after (re)connecting, when anything may have changed unseen
+DB_LISTEN = os.environ.get('DB_LISTEN', '1') != '0'
+db_listener = {
+    "handlers": {},
+    "pid": None,
+    "lock": threading.Lock()
+}
+
+def on_db_notify(channel, handler):
+    db_listener["handlers"].setdefault(channel, []).append(handler)
+
+def listen_for_db_notifications():
+    """
+    Dispatch notifications to the registered handlers. Runs on a daemon
+    thread with its own (unpooled) connection and reconnects after errors;
+    cache TTLs still bound staleness meanwhile.
+    """
+    while True:
+        try:
+            conn = get_db_connection()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for channel in db_listener["handlers"]:
+                    cur.execute(f"LISTEN {channel}")
+            for handlers in db_listener["handlers"].values():
+                for handler in handlers:
+                    handler(None)
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    for handler in db_listener["handlers"].get(notify.channel, []):
+                        handler(notify.payload or None)
+        except Exception as e:
+            logger.warning("DB listener error: %s", e)
+            time.sleep(5)
+
+@app.before_request
+def start_db_listener():
+    if DB_LISTEN and db_listener["pid"] != os.getpid():
+        with db_listener["lock"]:
+            if db_listener["pid"] != os.getpid():
+                threading.Thread(target=listen_for_db_notifications, daemon=True).start()
+                db_listener["pid"] = os.getpid()
+
+class NotifiedJob:
+    """
+    Runs `job(cur)` on a background thread whenever `channel` is notified, and
+    once when the listener (re)connects to catch up. Notifications arriving
+    mid-run trigger one more pass rather than one each. The job holds a
+    transaction-level advisory lock, so when every worker is notified only
+    one of them does the work.
+    """
+
+    def __init__(self, channel, job):
+        self.channel = channel
+        self.job = job
+        self.lock_key = int.from_bytes(hashlib.sha1(channel.encode()).digest()[:8], 'big', signed=True)
+        self.lock = threading.Lock()
+        self.pending = False
+        self.running = False
+        on_db_notify(channel, self.notify)
 
+    def notify(self, payload=None):
+        with self.lock:
+            self.pending = True
+            if self.running:
+                return
+            self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.running = False
+                    return
+                self.pending = False
+            try:
+                with db_cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (self.lock_key,))
+                    if cur.fetchone()['locked']:
+                        self.job(cur)
+            except Exception as e:
+                logger.warning("Error running %s job: %s", self.channel, e)
+
+# Pre-serialised responses for read-mostly routes, invalidated by the tables they read
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+response_cache_state = {
+    "entries": OrderedDict(),  # request path -> entry dict
+    "table_versions": {},  # table name -> bumped on every change notification
+    "lock": threading.Lock(),
+    "hits": 0,
+    "not_modified": 0,
+    "misses": 0
+}
+
+def purge_response_cache(prefix=None):
+    """Drop cached responses whose path starts with `prefix`, or all of them."""
+    with response_cache_state["lock"]:
+        entries = response_cache_state["entries"]
+        for path in [p for p in entries if prefix is None or p.startswith(prefix)]:
+            del entries[path]
+
+def bump_table_version(table):
+    with response_cache_state["lock"]:
+        versions = response_cache_state["table_versions"]
+        if table is None:
+            response_cache_state["entries"].clear()
+        else:
+            versions[table] = versions.get(table, 0) + 1
+
+on_db_notify('table_changed', bump_table_version)
+on_db_notify('response_cache_purge', purge_response_cache)
+
+def compress_response(body):
+    encodings = {"gzip": gzip.compress(body, compresslevel=6)}
+    if brotli is not None:
+        encodings["br"] = brotli.compress(body)
+    return encodings
+
+def cached_response(entry):
+    """Serve a cache entry, answering If-None-Match with 304 and picking the best encoding."""
+    if request.if_none_match.contains(entry["etag"]):
+        response_cache_state["not_modified"] += 1
+        response = Response(status=304)
+    else:
+        accepted = request.accept_encodings
+        encoding = next((e for e in ("br", "gzip") if e in entry["encoded"] and accepted[e]), None)
+        response = Response(entry["encoded"][encoding] if encoding else entry["body"], mimetype=entry["mimetype"])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(entry["etag"])
+    response.headers.extend(entry["headers"])
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+CACHED_RESPONSE_HEADERS = ('Link',)  # view-set headers kept with a cache entry
+
+def response_cache(*tables, ttl=None):
+    """
+    Cache a GET route's successful JSON responses as bytes (plus gzip/brotli
+    copies) keyed by path and query string, with a content-hash ETag. An entry
+    is dropped when any of `tables` changes (via the table_changed trigger),
+    on explicit purge, or after `ttl` seconds.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start_db_listener()
+            key = request.full_path
+            now = time.time()
+            with response_cache_state["lock"]:
+                entry = response_cache_state["entries"].get(key)
+                versions = tuple(response_cache_state["table_versions"].get(t, 0) for t in tables)
+                if entry and entry["versions"] == versions and now - entry["stored_at"] < (ttl or RESPONSE_CACHE_TTL):
+                    response_cache_state["entries"].move_to_end(key)
+                    response_cache_state["hits"] += 1
+                else:
+                    entry = None
+                    response_cache_state["misses"] += 1
+            CACHE_LOOKUPS.labels('response', 'hit' if entry else 'miss').inc()
+            if entry:
+                return cached_response(entry)
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            entry = {
+                "body": body,
+                "encoded": compress_response(body),
+                "etag": hashlib.sha1(body).hexdigest(),
+                "mimetype": response.mimetype,
+                "headers": [(k, v) for k, v in response.headers.items() if k in CACHED_RESPONSE_HEADERS],
+                "versions": versions,
+                "stored_at": now
+            }
+            with response_cache_state["lock"]:
+                entries = response_cache_state["entries"]
+                entries[key] = entry
+                entries.move_to_end(key)
+                while len(entries) > RESPONSE_CACHE_SIZE:
+                    entries.popitem(last=False)
+            return cached_response(entry)
+        return wrapper
+    return decorator
+
+@app.cli.command('purge-response-cache')
+@click.argument('prefix', required=False)
+def purge_response_cache_command(prefix):
+    """Tell every worker to drop cached responses (optionally only under PREFIX)."""
+    with db_cursor() as cur:
+        cur.execute("SELECT pg_notify('response_cache_purge', %s)", (prefix or '',))
+    click.echo("Purge requested")
+
+@app.cli.command('ingest-results')
+@click.option('--season', type=int, help='Season year (default: current).')
+@click.option('--round', 'round_num', type=int, help='Round number (default: current).')
+def ingest_results_command(season, round_num):
+    """Fetch a round's draw from nrl.com and write changed scores to `matches`."""
+    if season is None or round_num is None:
+        current_season, current_round = fetch_current_season_and_round()
+        season = season or current_season
+        round_num = round_num or current_round
+    written = ingest_round_draw(season, round_num, fetch_round_draw(season, round_num))
+    click.echo(f"Ingested {len(written)} changed fixtures for {season} round {round_num}")
+
+@app.route('/latest-results')
+@response_cache('matches', 'rounds', 'seasons', 'teams', ttl=300)
+def latest_results():
+    """Scored matches in the current round, as ingested from nrl.com."""
+    season, round_num = get_current_season_and_round()
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT t_home.name AS home, t_away.name AS away, m.home_score, m.away_score
+            FROM matches m
+            JOIN rounds r ON m.round_id = r.id
+            JOIN seasons s ON r.season_id = s.id
+            JOIN teams t_home ON m.home_team_id = t_home.id
+            JOIN teams t_away ON m.away_team_id = t_away.id
+            WHERE s.year = %s AND r.round_number = %s
+              AND m.home_score IS NOT NULL AND m.away_score IS NOT NULL
+            ORDER BY m.date, m.id
+        """, (season, round_num))
+        results = cur.fetchall()
+    for row in results:
+        row['winner'] = row['home_score'] > row['away_score'] and row['home'] or row['away']
     return app.response_class(
         response=json.dumps(results),
         status=200,
         mimetype='application/json'
     )
     
+KEYSET_MAX_LIMIT = int(os.environ.get('KEYSET_MAX_LIMIT', 1000))
+STREAM_ITERSIZE = int(os.environ.get('STREAM_ITERSIZE', 500))  # rows per server-side cursor fetch
+
+def keyset_args():
+    """
+    Parse ?after=<date>,<id> and ?limit= for keyset pagination over (date, id).
+    The date may be ISO 8601, as in Link headers, or an HTTP date, as JSON
+    and NDJSON rows serialise it, so a row's own date and id continue from it.
+    Returns (after, limit), each None when absent; raises ValueError if malformed.
+    """
+    after = request.args.get('after')
+    if after:
+        try:
+            date_part, id_part = after.rsplit(',', 1)
+            after = (parse_keyset_date(date_part), int(id_part))
+        except ValueError:
+            raise ValueError("after must be <ISO or HTTP date>,<id>")
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= KEYSET_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {KEYSET_MAX_LIMIT}")
+    return after or None, limit
+
+def parse_keyset_date(value):
+    """
+    ISO 8601 or HTTP date string as a datetime. HTTP dates are GMT and are
+    returned naive, matching how the app serialises naive timestamps.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        parsed = parse_http_date(value)
+        if parsed is None:
+            raise
+        return parsed.replace(tzinfo=None)
+
+def next_page_link(date, row_id, limit):
+    """Link header for the page after the row (date, row_id), keeping the other query args."""
+    args = request.args.to_dict()
+    args.update(after=f"{date.isoformat()},{row_id}", limit=limit)
+    return f'<{request.path}?{urlencode(args)}>; rel="next"'
+
+def stream_ndjson(sql, params):
+    """
+    Stream query rows as NDJSON from a server-side cursor, so memory stays
+    flat however many rows match and the first rows go out before the rest
+    are read. The pooled connection is held until the stream ends.
+    """
+    def generate():
+        with db_cursor(name='stream_ndjson') as cur:
+            cur.itersize = STREAM_ITERSIZE
+            cur.execute(sql, params)
+            for row in cur:
+                yield app.json.dumps(row) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/upcoming_matches')
+@response_cache('matches', 'rounds', 'seasons', 'teams')
 def upcoming_matches():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("""
+    """
+    Unfinished matches from today on, in (date, match_id) order. Optional
+    keyset pagination: ?limit=N returns N matches, with a Link rel="next"
+    header whose ?after=<date>,<match_id> continues from the last one.
+    ?format=ndjson streams one JSON object per line instead (no Link header;
+    continue with ?after=<date>,<match_id> from the last row as serialised).
+    """
+    try:
+        after, limit = keyset_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    params = []
+    if after:
+        params += after
+    if limit:
+        params.append(limit)
+    sql = f"""
         SELECT
             m.id as match_id,
             m.date,
@@ -220,205 +1556,360 @@ def upcoming_matches():
         JOIN teams t_away ON m.away_team_id = t_away.id
         WHERE m.is_finished = FALSE
           AND m.date >= CURRENT_DATE
-        ORDER BY m.date ASC, r.round_number ASC
-    """)
-    matches = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(matches)
+          {"AND (m.date, m.id) > (%s, %s)" if after else ""}
+        ORDER BY m.date ASC, m.id ASC
+        {"LIMIT %s" if limit else ""}
+    """
+    if request.args.get('format') == 'ndjson':
+        return stream_ndjson(sql, params)
+
+    with db_cursor() as cur:
+        cur.execute(sql, params)
+        matches = cur.fetchall()
+    response = jsonify(matches)
+    if limit and len(matches) == limit:
+        response.headers['Link'] = next_page_link(matches[-1]['date'], matches[-1]['match_id'], limit)
+    return response
 
 @app.route('/api/current_round_matches')
+@response_cache('matches', 'rounds', 'seasons', 'teams')
 def current_round_matches():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    # 1. Get the current round_id (whose start_date <= today)
-    cur.execute("""
-        SELECT id, round_number, season_id
-        FROM rounds
-        WHERE start_date <= CURRENT_DATE
-        ORDER BY start_date DESC
-        LIMIT 1
-    """)
-    round_row = cur.fetchone()
-    if not round_row:
-        cur.close()
-        conn.close()
-        return jsonify({"error": "No round found"}), 404
+    with db_cursor() as cur:
+        # 1. Get the current round_id (whose start_date <= today)
+        cur.execute("""
+            SELECT id, round_number, season_id
+            FROM rounds
+            WHERE start_date <= CURRENT_DATE
+            ORDER BY start_date DESC
+            LIMIT 1
+        """)
+        round_row = cur.fetchone()
+        if not round_row:
+            return jsonify({"error": "No round found"}), 404
 
-    round_id = round_row["id"]
+        round_id = round_row["id"]
 
-    # 2. Get all matches for that round
-    cur.execute("""
-        SELECT
-            m.id as match_id,
-            m.date,
-            r.round_number,
-            s.year as season_year,
-            t_home.name as home_team,
-            t_away.name as away_team,
-            m.venue,
-            m.is_finished,
-            m.home_score,
-            m.away_score
-        FROM matches m
-        JOIN rounds r ON m.round_id = r.id
-        JOIN seasons s ON r.season_id = s.id
-        JOIN teams t_home ON m.home_team_id = t_home.id
-        JOIN teams t_away ON m.away_team_id = t_away.id
-        WHERE m.round_id = %s
-        ORDER BY m.date ASC
-    """, (round_id,))
+        # 2. Get all matches for that round
+        cur.execute("""
+            SELECT
+                m.id as match_id,
+                m.date,
+                r.round_number,
+                s.year as season_year,
+                t_home.name as home_team,
+                t_away.name as away_team,
+                m.venue,
+                m.is_finished,
+                m.home_score,
+                m.away_score
+            FROM matches m
+            JOIN rounds r ON m.round_id = r.id
+            JOIN seasons s ON r.season_id = s.id
+            JOIN teams t_home ON m.home_team_id = t_home.id
+            JOIN teams t_away ON m.away_team_id = t_away.id
+            WHERE m.round_id = %s
+            ORDER BY m.date ASC
+        """, (round_id,))
 
-    matches = cur.fetchall()
-    cur.close()
-    conn.close()
+        matches = cur.fetchall()
     return jsonify(matches)
 
-@app.route('/api/match_team_lists/<int:match_id>')
-def match_team_lists(match_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+# Normalise team list position names
+NRL_POSITION_MAP = {
+    'FB': 'Fullback', 'Fullback': 'Fullback',
+    'WG': 'Wing', 'Wing': 'Wing',
+    'CE': 'Centre', 'Centre': 'Centre',
+    'FE': 'Five-eighth', 'Five-eighth': 'Five-eighth',
+    'HB': 'Halfback', 'Halfback': 'Halfback',
+    'PR': 'Front row', 'Front row': 'Front row', 
+    'HK': 'Hooker', 'Hooker': 'Hooker',
+    'SR': 'Second row', 'Second row': 'Second row',
+    'LK': 'Lock', 'Lock': 'Lock',
+    'Interchange': 'Bench', 'Bench': 'Bench', 'Reserve': 'Bench'
+}
 
-    # Get home/away team IDs and names for the match
+# Starting 13 in NRL order: (position, 'min' = lowest jersey / 'max' = highest jersey)
+NRL_STARTING_ORDER = [
+    ('Fullback', 'min'),
+    ('Wing', 'min'),
+    ('Centre', 'min'),
+    ('Centre', 'max'),
+    ('Wing', 'max'),
+    ('Five-eighth', 'min'),
+    ('Halfback', 'min'),
+    ('Front row', 'min'),
+    ('Hooker', 'min'),
+    ('Front row', 'max'),
+    ('Second row', 'min'),
+    ('Second row', 'max'),
+    ('Lock', 'min')
+]
+
+def order_nrl_team_list(players):
+    """
+    Select a team list in NRL order (1-13 as NRL_STARTING_ORDER, then the 4
+    lowest-jersey bench players). Players are bucketed once by normalised
+    position and jersey-sorted; each bucket keeps low/high pointers to its
+    unpicked range, and each pick moves one of them inward. Players without a
+    jersey number are never picked.
+    """
+    groups = {}
+    for p in players:
+        p['norm_pos'] = NRL_POSITION_MAP.get(p['position'], p['position'])
+        if p['jersey_number'] is not None:
+            groups.setdefault(p['norm_pos'], []).append(p)
+    for group in groups.values():
+        group.sort(key=lambda x: x['jersey_number'])  # stable, so ties keep list order
+    bounds = {norm_pos: [0, len(group) - 1] for norm_pos, group in groups.items()}
+    used_players = set()
+    result = []
+
+    def pick(norm_pos, end):
+        group = groups.get(norm_pos)
+        if not group:
+            return None
+        # The same id may be listed under several positions; skip any already picked
+        lo, hi = bounds[norm_pos]
+        while lo <= hi and group[lo]['id'] in used_players:
+            lo += 1
+        while lo <= hi and group[hi]['id'] in used_players:
+            hi -= 1
+        bounds[norm_pos] = [lo, hi]
+        if lo > hi:
+            return None
+        if end == 'min':
+            target = group[lo]
+        else:
+            # first unpicked of any highest-jersey ties, as max() would choose
+            first = hi
+            while first > lo and group[first - 1]['jersey_number'] == group[hi]['jersey_number']:
+                first -= 1
+            target = next(p for p in group[first:hi + 1] if p['id'] not in used_players)
+        used_players.add(target['id'])
+        return target
+
+    for norm_pos, end in NRL_STARTING_ORDER:
+        target = pick(norm_pos, end)
+        if target:
+            result.append(target)
+    bench = [p for p in groups.get('Bench', []) if p['id'] not in used_players]
+    for p in bench[:4]:
+        used_players.add(p['id'])
+        result.append(p)
+    return result
+
+def fetch_team_lists(cur, match_ids):
+    """
+    Both sides' named players in NRL order for each match, as {match_id: {...}},
+    from two queries however many matches are asked for. Unknown matches are omitted.
+    """
     cur.execute("""
-        SELECT m.home_team_id, m.away_team_id, t1.name as home_team, t2.name as away_team
+        SELECT m.id AS match_id, m.home_team_id, m.away_team_id, t1.name as home_team, t2.name as away_team
         FROM matches m
         JOIN teams t1 ON m.home_team_id = t1.id
         JOIN teams t2 ON m.away_team_id = t2.id
-        WHERE m.id = %s
-    """, (match_id,))
-    match = cur.fetchone()
-    if not match:
-        cur.close()
-        conn.close()
-        return jsonify({"error": "Match not found"}), 404
+        WHERE m.id = ANY(%s)
+    """, (list(match_ids),))
+    matches = {row['match_id']: row for row in cur.fetchall()}
+    if not matches:
+        return {}
 
-    # Get all players for the team (excluding 'Replacement')
-    def get_team_players(team_id):
-        cur.execute("""
-            SELECT p.id, p.name, tl.position, tl.starter, tl.jersey_number, tl.team_id
-            FROM team_list tl
-            JOIN players p ON tl.player_id = p.id
-            WHERE tl.match_id = %s AND tl.team_id = %s AND tl.position <> 'Replacement'
-        """, (match_id, team_id))
-        players = cur.fetchall()
-        return players
-
-    # Helper to select team list in NRL order
-    def order_nrl_team_list(players):
-        # Normalize and group players
-        pos_map = {
-            'FB': 'Fullback', 'Fullback': 'Fullback',
-            'WG': 'Wing', 'Wing': 'Wing',
-            'CE': 'Centre', 'Centre': 'Centre',
-            'FE': 'Five-eighth', 'Five-eighth': 'Five-eighth',
-            'HB': 'Halfback', 'Halfback': 'Halfback',
-            'PR': 'Front row', 'Front row': 'Front row', 
-            'HK': 'Hooker', 'Hooker': 'Hooker',
-            'SR': 'Second row', 'Second row': 'Second row',
-            'LK': 'Lock', 'Lock': 'Lock',
-            'Interchange': 'Bench', 'Bench': 'Bench', 'Reserve': 'Bench'
+    # Get all players for both teams of every match (excluding 'Replacement')
+    cur.execute("""
+        SELECT p.id, p.name, tl.position, tl.starter, tl.jersey_number, tl.team_id, tl.match_id
+        FROM team_list tl
+        JOIN players p ON tl.player_id = p.id
+        WHERE tl.match_id = ANY(%s) AND tl.position <> 'Replacement'
+    """, (list(matches),))
+    players = {}
+    for row in cur.fetchall():
+        players.setdefault((row.pop('match_id'), row['team_id']), []).append(row)
+
+    team_lists = {}
+    for match_id, match in matches.items():
+        team_lists[match_id] = {
+            "home_team_id": match['home_team_id'],
+            "home_team": match['home_team'],
+            "home_players": order_nrl_team_list(players.get((match_id, match['home_team_id']), [])),
+            "away_team_id": match['away_team_id'],
+            "away_team": match['away_team'],
+            "away_players": order_nrl_team_list(players.get((match_id, match['away_team_id']), []))
         }
+    return team_lists
+
+def fetch_match_team_lists(cur, match_id):
+    """Both sides' named players in NRL order, or None if the match doesn't exist."""
+    return fetch_team_lists(cur, [match_id]).get(match_id)
+
+@app.route('/api/match_team_lists')
+@response_cache('matches', 'teams', 'team_list', 'players')
+def match_team_lists_multi():
+    """
+    Team lists for several matches at once: /api/match_team_lists?ids=1,2,3
+    Returns {"matches": [...], "not_found": [...]} in the order requested.
+    """
+    try:
+        match_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of match ids"}), 400
+    if not match_ids or len(match_ids) > 50:
+        return jsonify({"error": "Provide between 1 and 50 match ids"}), 400
+
+    with db_cursor() as cur:
+        team_lists = fetch_team_lists(cur, match_ids)
 
-        # Normalize positions
-        for p in players:
-            p['norm_pos'] = pos_map.get(p['position'], p['position'])
-        used_players = set()
-        result = []
-
-        # Helper to pick from group and mark used
-        def pick(players, norm_pos, pick='min'):
-            # pick: 'min' (lowest jersey), 'max' (highest jersey)
-            candidates = [p for p in players if p['norm_pos'] == norm_pos and p['id'] not in used_players]
-            if not candidates:
-                return None
-            candidates = [p for p in candidates if p['jersey_number'] is not None]
-            if not candidates:
-                return None
-            target = min(candidates, key=lambda x: x['jersey_number']) if pick == 'min' else max(candidates, key=lambda x: x['jersey_number'])
-            used_players.add(target['id'])
-            return target
-
-        # 1. Fullback
-        fb = pick(players, 'Fullback')
-        if fb: result.append(fb)
-        # 2. Wing (lowest jersey)
-        wing1 = pick(players, 'Wing', pick='min')
-        if wing1: result.append(wing1)
-        # 3. Centre (lowest jersey)
-        centre1 = pick(players, 'Centre', pick='min')
-        if centre1: result.append(centre1)
-        # 4. Centre (highest jersey)
-        centre2 = pick(players, 'Centre', pick='max')
-        if centre2: result.append(centre2)
-        # 5. Wing (highest jersey)
-        wing2 = pick(players, 'Wing', pick='max')
-        if wing2: result.append(wing2)
-        # 6. Five-eighth
-        fe = pick(players, 'Five-eighth')
-        if fe: result.append(fe)
-        # 7. Halfback
-        hb = pick(players, 'Halfback')
-        if hb: result.append(hb)
-        # 8. Prop (lowest jersey)
-        prop1 = pick(players, 'Front row', pick='min')
-        if prop1: result.append(prop1)
-        # 9. Hooker
-        hk = pick(players, 'Hooker')
-        if hk: result.append(hk)
-        # 10. Prop (highest jersey)
-        prop2 = pick(players, 'Front row', pick='max')
-        if prop2: result.append(prop2)
-        # 11. Second Row (lowest jersey)
-        sr1 = pick(players, 'Second row', pick='min')
-        if sr1: result.append(sr1)
-        # 12. Second Row (highest jersey)
-        sr2 = pick(players, 'Second row', pick='max')
-        if sr2: result.append(sr2)
-        # 13. Lock
-        lk = pick(players, 'Lock')
-        if lk: result.append(lk)
-        # 14–17. Bench (lowest jerseys)
-        bench = [p for p in players if p['norm_pos'] == 'Bench' and p['id'] not in used_players]
-        bench = [p for p in bench if p['jersey_number'] is not None]
-        bench.sort(key=lambda x: x['jersey_number'])
-        for p in bench[:4]:
-            used_players.add(p['id'])
-            result.append(p)
-        return result
-
-    # Get and order home and away teams
-    home_players = order_nrl_team_list(get_team_players(match['home_team_id']))
-    away_players = order_nrl_team_list(get_team_players(match['away_team_id']))
-
-    cur.close()
-    conn.close()
     return jsonify({
-        "home_team": match['home_team'],
-        "home_players": home_players,
-        "away_team": match['away_team'],
-        "away_players": away_players
+        "matches": [
+            {
+                "match_id": match_id,
+                "home_team": team_lists[match_id]['home_team'],
+                "home_players": team_lists[match_id]['home_players'],
+                "away_team": team_lists[match_id]['away_team'],
+                "away_players": team_lists[match_id]['away_players']
+            }
+            for match_id in dict.fromkeys(match_ids) if match_id in team_lists
+        ],
+        "not_found": [match_id for match_id in dict.fromkeys(match_ids) if match_id not in team_lists]
+    })
+
+@app.route('/api/match_team_lists/<int:match_id>')
+@response_cache('matches', 'teams', 'team_list', 'players')
+def match_team_lists(match_id):
+    with db_cursor() as cur:
+        team_lists = fetch_match_team_lists(cur, match_id)
+    if not team_lists:
+        return jsonify({"error": "Match not found"}), 404
+
+    return jsonify({
+        "home_team": team_lists['home_team'],
+        "home_players": team_lists['home_players'],
+        "away_team": team_lists['away_team'],
+        "away_players": team_lists['away_players']
     })
     
-@app.route('/api/player_try_probabilities/<int:match_id>/<int:team_id>')
-def player_try_probabilities(match_id, team_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+# Season window for try rates: the 2 most recent seasons
+RECENT_SEASONS_SQL = "SELECT id FROM seasons ORDER BY year DESC LIMIT 2"
 
-    # Get last 3 seasons' IDs
-    cur.execute("SELECT id FROM seasons ORDER BY year DESC LIMIT 2")
-    recent_season_ids = [row['id'] for row in cur.fetchall()]
+def fetch_player_try_stats(cur, match_id, team_ids):
+    """
+    Tries and appearances at the named position over the last 2 seasons for
+    every player named for this match by any of `team_ids`. Reads player_position_try_rates
+    when it has been built for the current season window and nothing is
+    queued for refresh, otherwise aggregates player_stats directly in one
+    grouped query.
+    """
+    cur.execute(f"""
+        SELECT season_ids = ARRAY({RECENT_SEASONS_SQL})
+            AND NOT EXISTS (SELECT 1 FROM try_rate_refresh_queue)
+            AND NOT EXISTS (SELECT 1 FROM try_rate_player_queue) AS fresh
+        FROM try_rate_refresh_state
+    """)
+    state = cur.fetchone()
+    if state and state['fresh']:
+        cur.execute("""
+            SELECT named.team_id, named.id, named.position, rates.tries, rates.matches_played
+            FROM (
+                SELECT DISTINCT tl.team_id, p.id, tl.position
+                FROM team_list tl
+                JOIN players p ON tl.player_id = p.id
+                WHERE tl.match_id = %s AND tl.team_id = ANY(%s) AND tl.position <> 'Replacement'
+            ) named
+            LEFT JOIN player_position_try_rates rates
+                ON rates.player_id = named.id AND rates.position = named.position
+        """, (match_id, list(team_ids)))
+        return cur.fetchall()
+
+    cur.execute(f"""
+        SELECT
+            named.team_id,
+            named.id,
+            named.position,
+            SUM(COALESCE(ps.tries, 0)) AS tries,
+            COUNT(ps.player_id) AS matches_played
+        FROM (
+            SELECT DISTINCT tl.team_id, p.id, tl.position
+            FROM team_list tl
+            JOIN players p ON tl.player_id = p.id
+            WHERE tl.match_id = %s AND tl.team_id = ANY(%s) AND tl.position <> 'Replacement'
+        ) named
+        LEFT JOIN (
+            player_stats ps
+            JOIN matches m ON ps.match_id = m.id
+            JOIN rounds r ON m.round_id = r.id
+                AND r.season_id IN ({RECENT_SEASONS_SQL})
+        ) ON ps.player_id = named.id AND ps.position = named.position
+        GROUP BY named.team_id, named.id, named.position
+    """, (match_id, list(team_ids)))
+    return cur.fetchall()
+
+def refresh_player_try_rates(cur, full=False):
+    """
+    Bring player_position_try_rates up to date. Only players with stats in
+    matches queued by the is_finished and player_stats triggers, plus players
+    whose stats rows were deleted or re-pointed, are recomputed, unless `full`
+    is set or the season window has moved, in which case the table is rebuilt.
+    Returns the number of (player, position) rows written.
+    """
+    cur.execute(RECENT_SEASONS_SQL)
+    season_ids = [row['id'] for row in cur.fetchall()]
+    cur.execute("SELECT season_ids FROM try_rate_refresh_state FOR UPDATE")
+    state = cur.fetchone()
+    if not state or sorted(state['season_ids']) != sorted(season_ids):
+        full = True
+
+    # Claim the queue up front: matches queued while this runs stay queued
+    cur.execute("DELETE FROM try_rate_refresh_queue RETURNING match_id")
+    queued = [row['match_id'] for row in cur.fetchall()]
+    cur.execute("DELETE FROM try_rate_player_queue RETURNING player_id")
+    queued_players = {row['player_id'] for row in cur.fetchall()}
+
+    aggregate = """
+        INSERT INTO player_position_try_rates (player_id, position, tries, matches_played)
+        SELECT ps.player_id, ps.position, SUM(COALESCE(ps.tries, 0)), COUNT(*)
+        FROM player_stats ps
+        JOIN matches m ON ps.match_id = m.id
+        JOIN rounds r ON m.round_id = r.id
+        WHERE r.season_id = ANY(%s) AND ps.position IS NOT NULL
+          {players}
+        GROUP BY ps.player_id, ps.position
+    """
+    if full:
+        cur.execute("DELETE FROM player_position_try_rates")
+        cur.execute(aggregate.format(players=""), (season_ids,))
+    elif queued or queued_players:
+        cur.execute("""
+            SELECT DISTINCT player_id FROM player_stats WHERE match_id = ANY(%s)
+        """, (queued,))
+        player_ids = sorted(queued_players | {row['player_id'] for row in cur.fetchall()})
+        cur.execute("DELETE FROM player_position_try_rates WHERE player_id = ANY(%s)", (player_ids,))
+        cur.execute(aggregate.format(players="AND ps.player_id = ANY(%s)"), (season_ids, player_ids))
+    else:
+        return 0
+    written = cur.rowcount
 
-    # Get all players named for this match/team, with position
     cur.execute("""
-        SELECT p.id, tl.position
-        FROM team_list tl
-        JOIN players p ON tl.player_id = p.id
-        WHERE tl.match_id = %s AND tl.team_id = %s AND tl.position <> 'Replacement'
-    """, (match_id, team_id))
-    player_rows = cur.fetchall()
+        INSERT INTO try_rate_refresh_state (id, season_ids, refreshed_at)
+        VALUES (TRUE, %s, now())
+        ON CONFLICT (id) DO UPDATE SET season_ids = EXCLUDED.season_ids, refreshed_at = now()
+    """, (season_ids,))
+    return written
+
+try_rate_refresh_job = NotifiedJob('try_rate_refresh', refresh_player_try_rates)
 
+@app.cli.command('refresh-try-rates')
+@click.option('--full', is_flag=True, help='Rebuild every player rather than only those in newly finished matches.')
+def refresh_try_rates_command(full):
+    """Refresh player_position_try_rates after a round finishes."""
+    with db_cursor() as cur:
+        written = refresh_player_try_rates(cur, full=full)
+    click.echo(f"Refreshed {written} player/position try rates")
+
+def normalised_try_probabilities(player_rows):
+    """
+    Per-player share of a team's tries from fetch_player_try_stats rows,
+    falling back to position (then team) averages for players with fewer
+    than 5 appearances. Keys are player ids as strings.
+    """
     try_probs = {}
     pos_try_rates = {}  # position: list of (prob, matches_played)
 
@@ -426,20 +1917,8 @@ def player_try_probabilities(match_id, team_id):
     for row in player_rows:
         pid = row['id']
         position = row['position']
-        cur.execute("""
-            SELECT 
-                SUM(COALESCE(ps.tries, 0)) AS tries,
-                COUNT(*) AS matches_played
-            FROM player_stats ps
-            JOIN matches m ON ps.match_id = m.id
-            JOIN rounds r ON m.round_id = r.id
-            WHERE ps.player_id = %s
-              AND r.season_id = ANY(%s)
-              AND ps.position = %s
-        """, (pid, recent_season_ids, position))
-        stats = cur.fetchone()
-        tries = stats['tries'] or 0
-        matches_played = stats['matches_played'] or 0
+        tries = row['tries'] or 0
+        matches_played = row['matches_played'] or 0
         if matches_played >= 5:
             effective_tries = tries if tries > 0 else 1
             prob = effective_tries / matches_played
@@ -462,7 +1941,7 @@ def player_try_probabilities(match_id, team_id):
                 all_probs = [prob for pid2, prob in try_probs.items() if prob is not None]
                 avg = sum(all_probs) / len(all_probs) if all_probs else 0.05
             try_probs[pid] = avg
-            
+        
     # 5. NORMALIZE: so each value is the probability any given try by this team is scored by that player
     total_rate = sum(try_probs.values())
     if total_rate > 0:
@@ -471,30 +1950,423 @@ def player_try_probabilities(match_id, team_id):
         n = len(try_probs)
         norm_try_probs = {str(pid): 1 / n for pid in try_probs} if n > 0 else {}
 
-    cur.close()
-    conn.close()
-    return jsonify(norm_try_probs)
+    return norm_try_probs
 
-@app.route('/api/match_try_distribution/<int:match_id>/<int:team_id>')
-def match_try_distribution(match_id, team_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+@app.route('/api/player_try_probabilities/<int:match_id>/<int:team_id>')
+def player_try_probabilities(match_id, team_id):
+    with db_cursor() as cur:
+        player_rows = fetch_player_try_stats(cur, match_id, [team_id])
+    return jsonify(normalised_try_probabilities(player_rows))
+
+# Binary try distributions: little-endian float64 vectors indexed by try count,
+# with NaN marking try counts absent from the source dict
+TRY_DIST_DTYPE = np.dtype('<f8')
+
+def pack_try_dist(dist):
+    """Encode a {n_tries: prob} dict as bytes for the *_bin bytea columns."""
+    counts = {int(k): float(v) for k, v in dist.items()}
+    vec = np.full(max(counts, default=-1) + 1, np.nan, dtype=TRY_DIST_DTYPE)
+    for n_tries, p_n in counts.items():
+        vec[n_tries] = p_n
+    return vec.tobytes()
+
+def unpack_try_dist(buf):
+    """Zero-copy read-only view of a packed try distribution."""
+    return np.frombuffer(buf, dtype=TRY_DIST_DTYPE)
+
+def try_dist_array(row, column):
+    """
+    Try distribution from a row as a NaN-padded array, preferring the packed
+    `<column>_bin` value and falling back to the JSON column for old rows.
+    """
+    packed = row.get(column + '_bin')
+    if packed is not None:
+        return unpack_try_dist(packed)
+    return unpack_try_dist(pack_try_dist(row[column] or {}))
+
+def try_dist_dict(vec):
+    """Inverse of pack_try_dist for JSON responses: {"0": p0, "1": p1, ...}."""
+    return {str(k): float(vec[k]) for k in np.flatnonzero(~np.isnan(vec))}
 
+@app.cli.command('pack-try-dists')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows to convert per transaction.')
+def pack_try_dists_command(batch_size):
+    """Backfill the packed *_bin columns for rows that only have JSON distributions."""
+    targets = [
+        ('match_try_distributions', ['distribution']),
+        ('match_sgm_bins', ['home_try_dist', 'away_try_dist'])
+    ]
+    for table, columns in targets:
+        packed = 0
+        while True:
+            with db_cursor() as cur:
+                missing = ' OR '.join(f"{col}_bin IS NULL AND {col} IS NOT NULL" for col in columns)
+                cur.execute(f"SELECT ctid, {', '.join(columns)} FROM {table} WHERE {missing} LIMIT %s", (batch_size,))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                assignments = ', '.join(f"{col}_bin = %s" for col in columns)
+                execute_batch(cur, f"UPDATE {table} SET {assignments} WHERE ctid = %s", [
+                    [psycopg2.Binary(pack_try_dist(row[col] or {})) for col in columns] + [row['ctid']]
+                    for row in rows
+                ])
+            packed += len(rows)
+        click.echo(f"Packed {packed} rows in {table}")
+
+def fetch_try_distributions(cur, match_id, team_ids):
+    """Latest try distribution for each of `team_ids` in a match, as {team_id: {"0": p0, ...}}."""
     cur.execute("""
-        SELECT distribution
+        SELECT DISTINCT ON (team_id)
+               team_id, distribution_bin,
+               CASE WHEN distribution_bin IS NULL THEN distribution END AS distribution
         FROM match_try_distributions
-        WHERE match_id = %s AND team_id = %s
-        ORDER BY generated_at DESC
-        LIMIT 1
-    """, (match_id, team_id))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if not row or not row['distribution']:
-        # If there is no data, return an empty dict or a default distribution
-        return jsonify({})
-    return jsonify(row['distribution'])
+        WHERE match_id = %s AND team_id = ANY(%s)
+        ORDER BY team_id, generated_at DESC
+    """, (match_id, list(team_ids)))
+    dists = {}
+    for row in cur.fetchall():
+        if row['distribution_bin'] is not None:
+            dists[row['team_id']] = try_dist_dict(unpack_try_dist(row['distribution_bin']))
+        elif row['distribution']:
+            dists[row['team_id']] = row['distribution']
+    return dists
+
+@app.route('/api/match_try_distribution/<int:match_id>/<int:team_id>')
+@response_cache('match_try_distributions')
+def match_try_distribution(match_id, team_id):
+    with db_cursor() as cur:
+        dists = fetch_try_distributions(cur, match_id, [team_id])
+    # If there is no data, return an empty dict
+    return jsonify(dists.get(team_id, {}))
+
+PRICE_BOARD_MIN_TRIES = 3  # columns p_1plus .. p_3plus
+
+def tryscorer_board(try_dist, shares, max_tries=PRICE_BOARD_MIN_TRIES):
+    """
+    P(player scores >= m tries) for every player and m in 1..max_tries at
+    once. A single player's count given n team tries is Binomial(n, share),
+    so the survival function over a (players, m, n) grid weighted by the try
+    distribution gives the whole board. Returns a (players, max_tries) array.
+    """
+    dist = try_dist_vector(try_dist)
+    n = np.arange(dist.size)[None, None, :]
+    m = np.arange(1, max_tries + 1)[None, :, None]
+    p = np.asarray(shares, dtype=float)[:, None, None]
+    return binom_dist.sf(m - 1, n, p) @ dist
+
+def build_price_board(cur, match_ids):
+    """
+    Recompute the board for each match: singles for every named player and
+    every same-team pair scoring, from the same try shares and distributions
+    the read endpoints serve. Returns the number of player rows written.
+    """
+    cur.execute("SELECT id, home_team_id, away_team_id FROM matches WHERE id = ANY(%s)", (list(match_ids),))
+    written = 0
+    for match in cur.fetchall():
+        team_ids = [match['home_team_id'], match['away_team_id']]
+        player_rows = fetch_player_try_stats(cur, match['id'], team_ids)
+        dists = fetch_try_distributions(cur, match['id'], team_ids)
+        singles, pairs = [], []
+        for team_id in team_ids:
+            shares = normalised_try_probabilities([row for row in player_rows if row['team_id'] == team_id])
+            if not shares or not dists.get(team_id):
+                continue
+            player_ids = [int(pid) for pid in shares]
+            probs = [shares[pid] for pid in shares]
+            board = tryscorer_board(dists[team_id], probs)
+            singles += [
+                (match['id'], team_id, pid, share, *map(float, row))
+                for pid, share, row in zip(player_ids, probs, board)
+            ]
+            pair_index = [(i, j) for i in range(len(probs)) for j in range(i + 1, len(probs))]
+            both = price_sgm_combinations(dists[team_id], [([probs[i], probs[j]], [1, 1]) for i, j in pair_index])
+            pairs += [
+                (match['id'], team_id, player_ids[i], player_ids[j], p)
+                for (i, j), p in zip(pair_index, both)
+            ]
+        cur.execute("DELETE FROM tryscorer_price_board WHERE match_id = %s", (match['id'],))
+        cur.execute("DELETE FROM tryscorer_pair_board WHERE match_id = %s", (match['id'],))
+        if singles:
+            execute_values(cur, """
+                INSERT INTO tryscorer_price_board (match_id, team_id, player_id, try_share, p_1plus, p_2plus, p_3plus)
+                VALUES %s
+            """, singles)
+        if pairs:
+            execute_values(cur, """
+                INSERT INTO tryscorer_pair_board (match_id, team_id, player_id, other_player_id, p_both)
+                VALUES %s
+            """, pairs, page_size=1000)
+        written += len(singles)
+    return written
+
+def claim_price_board_queue(cur, match_ids=None):
+    """
+    Remove queued matches (all, or just `match_ids`) from price_board_queue and
+    return their ids. Claiming before building means a match re-queued by a
+    change made mid-build stays queued for the next one.
+    """
+    if match_ids is None:
+        cur.execute("DELETE FROM price_board_queue RETURNING match_id")
+    else:
+        cur.execute("DELETE FROM price_board_queue WHERE match_id = ANY(%s) RETURNING match_id", (list(match_ids),))
+    return {row['match_id'] for row in cur.fetchall()}
+
+def build_queued_price_boards(cur):
+    """Build the board for every queued match; run on price_board_refresh notifications."""
+    match_ids = claim_price_board_queue(cur)
+    return build_price_board(cur, sorted(match_ids)) if match_ids else 0
+
+price_board_job = NotifiedJob('price_board_refresh', build_queued_price_boards)
+
+@app.cli.command('build-price-board')
+@click.option('--match-id', type=int, multiple=True, help='Build these matches instead of the current round.')
+def build_price_board_command(match_id):
+    """Precompute tryscorer prices for the current round and any queued matches."""
+    with db_cursor() as cur:
+        if match_id:
+            match_ids = set(match_id)
+            claim_price_board_queue(cur, match_ids)
+        else:
+            match_ids = claim_price_board_queue(cur)
+            cur.execute("""
+                SELECT id FROM matches
+                WHERE round_id = (SELECT id FROM rounds WHERE start_date <= CURRENT_DATE ORDER BY start_date DESC LIMIT 1)
+            """)
+            match_ids |= {row['id'] for row in cur.fetchall()}
+        written = build_price_board(cur, sorted(match_ids))
+    click.echo(f"Built price boards for {len(match_ids)} matches ({written} players)")
+
+@app.route('/api/match_price_board/<int:match_id>')
+@response_cache('tryscorer_price_board', 'tryscorer_pair_board')
+def match_price_board(match_id):
+    """
+    Precomputed anytime / 2+ / 3+ prices for every named player, and the
+    chance both players of each same-team pair score, from `flask build-price-board`.
+    """
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT team_id, player_id, try_share, p_1plus, p_2plus, p_3plus, built_at
+            FROM tryscorer_price_board
+            WHERE match_id = %s
+            ORDER BY team_id, p_1plus DESC, player_id
+        """, (match_id,))
+        players = cur.fetchall()
+        if not players:
+            return jsonify({"error": "No price board for match"}), 404
+        cur.execute("""
+            SELECT team_id, player_id, other_player_id, p_both
+            FROM tryscorer_pair_board
+            WHERE match_id = %s
+            ORDER BY team_id, p_both DESC, player_id, other_player_id
+        """, (match_id,))
+        pairs = cur.fetchall()
+    built_at = max(row.pop('built_at') for row in players)
+    return jsonify({"match_id": match_id, "built_at": built_at, "players": players, "pairs": pairs})
+
+class SgmBinsIndex:
+    """
+    Summed-area tables over one match's (margin, total_points) bin grid.
+    Holds prefix sums of bin counts, count-weighted home/away try
+    distributions and key presence, so any margin x total rectangle is
+    answered from four corner lookups.
+    """
+    def __init__(self, rows):
+        self.margins = np.array(sorted({row['margin'] for row in rows}))
+        self.totals = np.array(sorted({row['total_points'] for row in rows}))
+
+        shape = (len(self.margins) + 1, len(self.totals) + 1)
+        # Shifted by one so row/column 0 stays zero padding
+        i = 1 + np.searchsorted(self.margins, [row['margin'] for row in rows])
+        j = 1 + np.searchsorted(self.totals, [row['total_points'] for row in rows])
+        c = np.array([row['count'] for row in rows], dtype=np.int64)
+
+        bins = np.zeros(shape, dtype=np.int64)
+        counts = np.zeros(shape, dtype=np.int64)
+        np.add.at(bins, (i, j), 1)
+        np.add.at(counts, (i, j), c)
+
+        def dense_dists(column):
+            vecs = [try_dist_array(row, column) for row in rows]
+            dense = np.full((len(rows), max(len(v) for v in vecs)), np.nan)
+            for r, vec in enumerate(vecs):
+                dense[r, :len(vec)] = vec
+            return dense
+
+        def weighted_grid(dense):
+            present = ~np.isnan(dense)
+            weighted = np.zeros(shape + dense.shape[1:])
+            seen = np.zeros(shape + dense.shape[1:], dtype=np.int64)
+            np.add.at(weighted, (i, j), np.where(present, dense, 0.0) * c[:, None])
+            np.add.at(seen, (i, j), present)
+            return weighted, seen
+
+        home_dists = dense_dists('home_try_dist')
+        away_dists = dense_dists('away_try_dist')
+        home, home_seen = weighted_grid(home_dists)
+        away, away_seen = weighted_grid(away_dists)
+
+        # Per-bin rows kept for pricing player legs bin by bin
+        self.row_margins = np.array([row['margin'] for row in rows])
+        self.row_totals = np.array([row['total_points'] for row in rows])
+        self.row_counts = c
+        self.row_dists = {"home": np.nan_to_num(home_dists), "away": np.nan_to_num(away_dists)}
+        self._leg_cache = OrderedDict()  # (side, legs) -> per-bin probabilities
+        self._leg_lock = threading.Lock()
+
+        self.bins, self.counts, self.home, self.away, self.home_seen, self.away_seen = (
+            arr.cumsum(axis=0).cumsum(axis=1)
+            for arr in (bins, counts, home, away, home_seen, away_seen)
+        )
+        self.all_count = int(self.counts[-1, -1])
+
+    def _bounds(self, values, gte, lte):
+        lo = int(np.searchsorted(values, gte, side='left')) if gte is not None else 0
+        hi = int(np.searchsorted(values, lte, side='right')) if lte is not None else len(values)
+        return lo, hi
+
+    @staticmethod
+    def _rect(sat, i0, i1, j0, j1):
+        return sat[i1, j1] - sat[i0, j1] - sat[i1, j0] + sat[i0, j0]
+
+    def query(self, margin_gte=None, margin_lte=None, total_gte=None, total_lte=None):
+        """
+        Aggregate the bins inside the rectangle. Returns None if no bins fall
+        in it, otherwise the selected count and the count-weighted (not yet
+        normalised) home/away distributions keyed by try count string.
+        """
+        i0, i1 = self._bounds(self.margins, margin_gte, margin_lte)
+        j0, j1 = self._bounds(self.totals, total_gte, total_lte)
+        if i1 <= i0 or j1 <= j0 or not self._rect(self.bins, i0, i1, j0, j1):
+            return None
+
+        def dist(weighted, seen):
+            sums = self._rect(weighted, i0, i1, j0, j1)
+            present = self._rect(seen, i0, i1, j0, j1)
+            return {str(k): float(sums[k]) for k in np.flatnonzero(present)}
+
+        return {
+            "count": int(self._rect(self.counts, i0, i1, j0, j1)),
+            "home_try_dist": dist(self.home, self.home_seen),
+            "away_try_dist": dist(self.away, self.away_seen)
+        }
+
+    def leg_probabilities(self, side, player_probs, min_tries):
+        """
+        Per-bin chance that every leg on one side ('home' or 'away') lands,
+        given that bin's try distribution for the side: one min-tries vector
+        for the legs, applied to all bins with a single matrix product.
+        Memoised by canonical legs, so every rectangle priced against this
+        match reuses it. The min-tries vector goes through run_pricing, so
+        heavy leg lists are priced in the pricing pool.
+        """
+        legs = canonical_legs(player_probs, min_tries)
+        key = (side, legs)
+        with self._leg_lock:
+            if key in self._leg_cache:
+                self._leg_cache.move_to_end(key)
+                return self._leg_cache[key]
+
+        dists = self.row_dists[side]
+        if not legs:
+            probs = np.ones(len(dists))
+        else:
+            n_max = dists.shape[1] - 1
+            cond = run_pricing(
+                min_tries_probabilities, n_max, [p for p, _ in legs], [m for _, m in legs],
+                work=try_count_work(n_max, [len(legs)])
+            )
+            probs = dists @ cond
+
+        with self._leg_lock:
+            self._leg_cache[key] = probs
+            while len(self._leg_cache) > SGM_BINS_LEG_CACHE_SIZE:
+                self._leg_cache.popitem(last=False)
+        return probs
+
+    def price(self, home_legs, away_legs, margin_gte=None, margin_lte=None, total_gte=None, total_lte=None):
+        """
+        Joint probability of landing in the rectangle and of every player leg,
+        where each leg list is (player_probs, min_tries). Home and away legs
+        are priced per bin and combined bin by bin, weighted by bin count, so
+        the correlation between the scoreline and tryscorers is kept.
+        Returns None if no bins fall in the rectangle.
+        """
+        mask = np.ones(len(self.row_counts), dtype=bool)
+        if margin_gte is not None:
+            mask &= self.row_margins >= margin_gte
+        if margin_lte is not None:
+            mask &= self.row_margins <= margin_lte
+        if total_gte is not None:
+            mask &= self.row_totals >= total_gte
+        if total_lte is not None:
+            mask &= self.row_totals <= total_lte
+        if not mask.any():
+            return None
+
+        weights = np.where(mask, self.row_counts, 0)
+        per_bin = self.leg_probabilities('home', *home_legs) * self.leg_probabilities('away', *away_legs)
+        all_count = self.all_count or 1
+        count = int(weights.sum())
+        joint = float(weights @ per_bin) / all_count
+        return {
+            "count": count,
+            "bins": int(mask.sum()),
+            "bins_prob": count / all_count,
+            "probability": joint,
+            "conditional_probability": joint * all_count / count if count else 0.0
+        }
+
+# Per-match SGM bin indexes, dropped on TTL expiry or when the bins are regenerated
+SGM_BINS_CACHE_TTL = float(os.environ.get('SGM_BINS_CACHE_TTL', 3600))
+SGM_BINS_CACHE_SIZE = int(os.environ.get('SGM_BINS_CACHE_SIZE', 256))
+SGM_BINS_LEG_CACHE_SIZE = int(os.environ.get('SGM_BINS_LEG_CACHE_SIZE', 512))  # per match
+sgm_bins_cache = {
+    "entries": OrderedDict(),  # match_id -> (index, built_at)
+    "lock": threading.Lock()
+}
+
+def invalidate_sgm_bins(match_id=None):
+    """Drop the cached bin index for one match, or for every match if None."""
+    with sgm_bins_cache["lock"]:
+        if match_id is None:
+            sgm_bins_cache["entries"].clear()
+        else:
+            sgm_bins_cache["entries"].pop(match_id, None)
+
+on_db_notify('sgm_bins_changed', lambda payload: invalidate_sgm_bins(int(payload) if payload else None))
+
+def get_sgm_bins_index(match_id):
+    """
+    Cached SgmBinsIndex for a match, built from one query on a miss.
+    Returns None if the match has no bins.
+    """
+    start_db_listener()
+    now = time.time()
+    with sgm_bins_cache["lock"]:
+        entry = sgm_bins_cache["entries"].get(match_id)
+        if entry and now - entry[1] < SGM_BINS_CACHE_TTL:
+            sgm_bins_cache["entries"].move_to_end(match_id)
+            CACHE_LOOKUPS.labels('sgm_bins', 'hit').inc()
+            return entry[0]
+    CACHE_LOOKUPS.labels('sgm_bins', 'miss').inc()
+
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT margin, total_points, count, home_try_dist_bin, away_try_dist_bin,
+                   CASE WHEN home_try_dist_bin IS NULL THEN home_try_dist END AS home_try_dist,
+                   CASE WHEN away_try_dist_bin IS NULL THEN away_try_dist END AS away_try_dist
+            FROM match_sgm_bins
+            WHERE match_id = %s
+        """, (match_id,))
+        rows = cur.fetchall()
+    index = SgmBinsIndex(rows) if rows else None
+
+    with sgm_bins_cache["lock"]:
+        sgm_bins_cache["entries"][match_id] = (index, now)
+        sgm_bins_cache["entries"].move_to_end(match_id)
+        while len(sgm_bins_cache["entries"]) > SGM_BINS_CACHE_SIZE:
+            sgm_bins_cache["entries"].popitem(last=False)
+    return index
 
 @app.route('/api/match_sgm_bins_range/<int:match_id>')
 def match_sgm_bins_range(match_id):
@@ -504,56 +2376,19 @@ def match_sgm_bins_range(match_id):
     total_gte = request.args.get('total_gte', type=int)
     total_lte = request.args.get('total_lte', type=int)
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    cur.execute("""
-        SELECT margin, total_points, home_try_dist, away_try_dist, count
-        FROM match_sgm_bins
-        WHERE match_id = %s
-    """, (match_id,))
-    bins = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    # Filter bins according to query params
-    filtered_bins = []
-    for row in bins:
-        m, t = row['margin'], row['total_points']
-        if margin_gte is not None and m < margin_gte:
-            continue
-        if margin_lte is not None and m > margin_lte:
-            continue
-        if total_gte is not None and t < total_gte:
-            continue
-        if total_lte is not None and t > total_lte:
-            continue
-        filtered_bins.append(row)
-
-    if not filtered_bins:
+    # Aggregate the selected rectangle from the match's summed-area tables
+    index = get_sgm_bins_index(match_id)
+    agg = index.query(margin_gte, margin_lte, total_gte, total_lte) if index else None
+    if not agg:
         return jsonify({"error": "No bins found for selection"}), 404
 
-    # Aggregate distributions weighted by count
-    total_count = sum(row['count'] for row in filtered_bins) or 1
-    agg_home_dist = {}
-    agg_away_dist = {}
-    for row in filtered_bins:
-        c = row['count']
-        # Home tries
-        for k, v in row['home_try_dist'].items():
-            agg_home_dist[k] = agg_home_dist.get(k, 0) + v * c
-        # Away tries
-        for k, v in row['away_try_dist'].items():
-            agg_away_dist[k] = agg_away_dist.get(k, 0) + v * c
-
     # Normalize
-    for k in agg_home_dist:
-        agg_home_dist[k] /= total_count
-    for k in agg_away_dist:
-        agg_away_dist[k] /= total_count
+    total_count = agg['count'] or 1
+    agg_home_dist = {k: v / total_count for k, v in agg['home_try_dist'].items()}
+    agg_away_dist = {k: v / total_count for k, v in agg['away_try_dist'].items()}
 
     # Probability of being in the selected bins
-    total_bins_count = sum(row['count'] for row in bins) or 1
+    total_bins_count = index.all_count or 1
     selection_prob = total_count / total_bins_count
 
     return jsonify({
@@ -567,26 +2402,104 @@ def match_sgm_bins_range(match_id):
     })
     
 @app.route('/api/match_sgm_bins_lines/<int:match_id>')
+@response_cache('match_sgm_bins')
 def match_sgm_bins_lines(match_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("""
-        SELECT DISTINCT margin, total_points
-        FROM match_sgm_bins
-        WHERE match_id = %s
-        ORDER BY margin, total_points
-    """, (match_id,))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    margins = sorted(set(row['margin'] for row in rows))
-    totals = sorted(set(row['total_points'] for row in rows))
+    index = get_sgm_bins_index(match_id)
     return jsonify({
-        "margins": margins,
-        "totals": totals
+        "margins": index.margins.tolist() if index else [],
+        "totals": index.totals.tolist() if index else []
     })
 
+@app.route('/api/match_sgm_probability/<int:match_id>', methods=['POST'])
+def match_sgm_probability(match_id):
+    """
+    Prices a margin/total selection together with tryscorer legs on either side.
+    Expects JSON body (every key optional):
+    {
+        "margin_gte": 1, "margin_lte": 12, "total_gte": null, "total_lte": 40,
+        "home": {"player_probs": [0.22, 0.15], "min_tries": [1, 1]},
+        "away": {"player_probs": [0.18], "min_tries": [2]}
+    }
+    "probability" is the chance of the whole multi; "conditional_probability"
+    is the chance of the player legs given the margin/total selection.
+    """
+    data = request.get_json() or {}
+    try:
+        bounds = {
+            name: None if data.get(name) is None else int(data[name])
+            for name in ('margin_gte', 'margin_lte', 'total_gte', 'total_lte')
+        }
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid input"}), 400
+    sides = {}
+    for side in ('home', 'away'):
+        legs = data.get(side) or {}
+        player_probs = legs.get('player_probs', []) if isinstance(legs, dict) else None
+        min_tries = legs.get('min_tries', []) if isinstance(legs, dict) else None
+        if not valid_legs(player_probs, min_tries):
+            return jsonify({
+                "error": f"Invalid {side} legs: player_probs must be probabilities in [0, 1] summing to "
+                         "at most 1, with a non-negative integer min_tries for each"
+            }), 400
+        sides[side] = (player_probs, min_tries)
+
+    index = get_sgm_bins_index(match_id)
+    if index:
+        check_pricing_work(sum(
+            try_count_work(index.row_dists[side].shape[1] - 1, [len(sides[side][0])])
+            for side in sides if sides[side][0]
+        ))
+    priced = index.price(sides['home'], sides['away'], **bounds) if index else None
+    if not priced:
+        return jsonify({"error": "No bins found for selection"}), 404
+    observe_sgm_selection(
+        'bins', index.row_dists['home'].shape[1] - 1,
+        [len(sides['home'][0]) + len(sides['away'][0])], priced['bins'], unit='bins'
+    )
+
+    return jsonify({
+        "match_id": match_id,
+        "margin_filter": {"gte": bounds['margin_gte'], "lte": bounds['margin_lte']},
+        "total_points_filter": {"gte": bounds['total_gte'], "lte": bounds['total_lte']},
+        "total_count": priced['count'],
+        "prob": priced['bins_prob'],
+        "probability": priced['probability'],
+        "conditional_probability": priced['conditional_probability']
+    })
+
+@app.route('/api/match_bundle/<int:match_id>')
+@response_cache('matches', 'teams', 'team_list', 'players', 'player_stats',
+                'player_position_try_rates', 'match_try_distributions', 'match_sgm_bins')
+def match_bundle(match_id):
+    """
+    Everything a match page needs in one response: both team lists, both
+    teams' player try probabilities and try distributions, and the SGM bin
+    margin/total lines, gathered on one pooled connection.
+    """
+    with db_cursor() as cur:
+        team_lists = fetch_match_team_lists(cur, match_id)
+        if not team_lists:
+            return jsonify({"error": "Match not found"}), 404
+        team_ids = [team_lists['home_team_id'], team_lists['away_team_id']]
+        player_rows = fetch_player_try_stats(cur, match_id, team_ids)
+        dists = fetch_try_distributions(cur, match_id, team_ids)
+    index = get_sgm_bins_index(match_id)
+
+    bundle = {"match_id": match_id}
+    for side, team_id in zip(("home", "away"), team_ids):
+        bundle[f"{side}_team_id"] = team_id
+        bundle[f"{side}_team"] = team_lists[f"{side}_team"]
+        bundle[f"{side}_players"] = team_lists[f"{side}_players"]
+        bundle[f"{side}_try_probabilities"] = normalised_try_probabilities(
+            [row for row in player_rows if row['team_id'] == team_id]
+        )
+        bundle[f"{side}_try_distribution"] = dists.get(team_id, {})
+    bundle["sgm_bins_lines"] = {
+        "margins": index.margins.tolist() if index else [],
+        "totals": index.totals.tolist() if index else []
+    }
+    return jsonify(bundle)
+
 @app.route('/api/sgm_probability', methods=['POST'])
 def sgm_probability():
     """
@@ -594,21 +2507,157 @@ def sgm_probability():
     {
         "try_dist": {"0":0.05,"1":0.10,"2":0.20,...},
         "player_probs": [0.22, 0.15, ...],
-        "min_tries": [1, 1, ...]
+        "min_tries": [1, 1, ...],
+        "mode": "exact"              (optional; or "simulate", also accepted as ?mode=)
+        "target_se": 0.001,          (optional, simulate only)
+        "seed": 0                    (optional, simulate only)
     }
+    mode=simulate returns a Monte Carlo estimate with its standard error and
+    sample count, for selections too large to price exactly.
     """
     data = request.get_json()
     try_dist = data.get('try_dist', {})
     player_probs = data.get('player_probs', [])
     min_tries = data.get('min_tries', [])
+    mode = request.args.get('mode') or data.get('mode', 'exact')
 
     # Validation
     if not try_dist or not player_probs or not min_tries or len(player_probs) != len(min_tries):
         return jsonify({"error": "Invalid input"}), 400
+    if not valid_legs(player_probs, min_tries):
+        return jsonify({
+            "error": "player_probs must be probabilities in [0, 1] summing to at most 1, "
+                     "with a non-negative integer min_tries for each"
+        }), 400
+    if not valid_try_dist(try_dist):
+        return jsonify({"error": f"try_dist must map try counts up to {SGM_MAX_TRY_COUNT} to probabilities"}), 400
+    if mode not in ('exact', 'simulate'):
+        return jsonify({"error": "mode must be 'exact' or 'simulate'"}), 400
+
+    if mode == 'simulate':
+        try:
+            target_se = float(data.get('target_se', SGM_SIM_TARGET_SE))
+            seed = int(data.get('seed', 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid target_se or seed"}), 400
+        if not target_se > 0 or seed < 0:
+            return jsonify({"error": "target_se must be positive and seed non-negative"}), 400
+        prob, se, samples = run_pricing(
+            simulate_min_tries_probability, try_dist, player_probs, min_tries, target_se,
+            SGM_SIM_MAX_SAMPLES, SGM_SIM_BATCH_SIZE, seed
+        )
+        observe_sgm_selection('simulate', max_tries(try_dist), [len(player_probs)], samples, unit='samples')
+        return jsonify({"probability": prob, "standard_error": se, "samples": samples, "mode": mode})
+
+    work = pricing_work(try_dist, [len(player_probs)])
+    check_pricing_work(work)
+    key = sgm_cache_key(try_dist, player_probs, min_tries)
 
-    prob = joint_min_tries_probability(try_dist, player_probs, min_tries)
+    def price():
+        prob = run_pricing(joint_min_tries_probability, try_dist, player_probs, min_tries, work=work)
+        observe_sgm_selection('exact', max_tries(try_dist), [len(player_probs)], 1)
+        return prob
+
+    prob = sgm_price_cache.get_or_compute(key, price)
     return jsonify({"probability": prob})
 
+@app.route('/api/sgm_probability/cache_stats')
+def sgm_probability_cache_stats():
+    return jsonify(sgm_price_cache.stats())
+
+
+@app.route('/api/sgm_probability/batch', methods=['POST'])
+def sgm_probability_batch():
+    """
+    Expects JSON body:
+    {
+        "try_dist": {"0":0.05,"1":0.10,"2":0.20,...},
+        "combinations": [
+            {"player_probs": [0.22, 0.15], "min_tries": [1, 1]},
+            {"player_probs": [0.15, 0.22], "min_tries": [1, 1]},
+            ...
+        ]
+    }
+    Returns {"probabilities": [...]} in the same order as "combinations".
+    """
+    data = request.get_json()
+    try_dist = data.get('try_dist', {})
+    combinations = data.get('combinations', [])
+
+    # Validation
+    if not try_dist or not combinations or not isinstance(combinations, list):
+        return jsonify({"error": "Invalid input"}), 400
+    if not valid_try_dist(try_dist):
+        return jsonify({"error": f"try_dist must map try counts up to {SGM_MAX_TRY_COUNT} to probabilities"}), 400
+    legs = []
+    for i, combo in enumerate(combinations):
+        player_probs = combo.get('player_probs', []) if isinstance(combo, dict) else []
+        min_tries = combo.get('min_tries', []) if isinstance(combo, dict) else []
+        if not player_probs or not valid_legs(player_probs, min_tries):
+            return jsonify({
+                "error": f"Invalid combination at index {i}: player_probs must be probabilities in [0, 1] "
+                         "summing to at most 1, with a non-negative integer min_tries for each"
+            }), 400
+        legs.append((player_probs, min_tries))
+
+    work = pricing_work(try_dist, [len(p) for p, _ in legs])
+    check_pricing_work(work)
+    probs = run_pricing(price_sgm_combinations, try_dist, legs, work=work)
+    distinct = {canonical_legs(p, m) for p, m in legs}
+    observe_sgm_selection('batch', max_tries(try_dist), [len(c) for c in distinct], len(distinct))
+    return jsonify({"probabilities": probs})
+
+
+@app.route('/api/db_pool_stats')
+def db_pool_stats_route():
+    return jsonify(db_pool_stats())
+
+class AppStatsCollector:
+    """
+    Point-in-time gauges read from this process's own state at scrape time
+    (pool usage, cache sizes). With PROMETHEUS_MULTIPROC_DIR set these come
+    from whichever worker serves the scrape.
+    """
+    def collect(self):
+        pool = GaugeMetricFamily('db_pool_connections', 'Pooled DB connections by state', labels=['state'])
+        stats = db_pool_stats()
+        for state in ('in_use', 'idle', 'open'):
+            pool.add_metric([state], stats[state])
+        yield pool
+        sizes = GaugeMetricFamily('cache_entries', 'Entries held by in-process caches', labels=['cache'])
+        sizes.add_metric(['sgm_price'], len(sgm_price_cache._entries))
+        sizes.add_metric(['response'], len(response_cache_state["entries"]))
+        sizes.add_metric(['sgm_bins'], len(sgm_bins_cache["entries"]))
+        yield sizes
+
+app_stats_collector = AppStatsCollector()
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    REGISTRY.register(app_stats_collector)
+
+@app.before_request
+def start_request_timer():
+    request.environ['app.started_at'] = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started_at = request.environ.get('app.started_at')
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(request.method, route, str(response.status_code)).observe(
+            time.perf_counter() - started_at
+        )
+    return response
+
+@app.route('/metrics')
+def metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        registry.register(app_stats_collector)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
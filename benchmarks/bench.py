@@ -0,0 +1,418 @@
+"""
+Benchmarks for the SGM pricing engine and the API routes.
+
+    python benchmarks/bench.py                    # seed the fixture, run everything
+    python benchmarks/bench.py --engine-only      # pricing functions only, no Postgres needed
+    python benchmarks/bench.py --filter route:    # cases whose name contains "route:"
+    python benchmarks/bench.py --save-baseline    # store this run as the baseline
+
+Route cases run through the Flask test client against a local Postgres
+fixture: the PG* environment variables pick the server and database, and
+everything lives in a dedicated schema (BENCH_SCHEMA, default "bench") that
+is dropped and re-seeded with synthetic seasons, matches, team lists,
+player_stats, try distributions and SGM bins, then brought up to date with
+migrations/, `flask pack-try-dists`, `flask refresh-try-rates --full` and
+`flask build-price-board`.
+
+Each case reports p50/p95/p99 latency, throughput and peak traced memory.
+With a baseline (benchmarks/baseline.json by default) any case whose p50 or
+p95 is slower than the baseline by more than --threshold is flagged and the
+exit status is 1. Baselines are machine-specific; record one on the machine
+that runs the comparison.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from itertools import combinations
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BENCH_SCHEMA = os.environ.get('BENCH_SCHEMA', 'bench')
+
+POSITIONS = [
+    'Fullback', 'Wing', 'Centre', 'Centre', 'Wing', 'Five-eighth', 'Halfback',
+    'Front row', 'Hooker', 'Front row', 'Second row', 'Second row', 'Lock',
+    'Interchange', 'Interchange', 'Interchange', 'Interchange'
+]
+# Rough tries per game by position, for synthetic player_stats
+POSITION_TRY_RATE = {
+    'Fullback': 0.45, 'Wing': 0.6, 'Centre': 0.4, 'Five-eighth': 0.2, 'Halfback': 0.15,
+    'Front row': 0.05, 'Hooker': 0.1, 'Second row': 0.2, 'Lock': 0.1, 'Interchange': 0.08
+}
+
+# The app reads its configuration at import time, so set it before importing
+os.environ['PGOPTIONS'] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={BENCH_SCHEMA}".strip()
+os.environ.setdefault('NRL_POLLER', '0')
+os.environ.setdefault('DB_LISTEN', '0')
+os.environ.setdefault('SGM_PRICING_PROCESSES', '0')
+os.environ.setdefault('UPSTREAM_CACHE_BACKEND', 'memory')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+sys.path.insert(0, REPO_DIR)
+
+import app  # noqa: E402
+from psycopg2.extras import Json, execute_values  # noqa: E402
+
+
+def poisson_dist(mean, length):
+    """Truncated, renormalised Poisson pmf over 0..length-1 tries."""
+    k = np.arange(length)
+    log_pmf = k * np.log(mean) - mean - np.cumsum(np.log(np.maximum(k, 1)))
+    pmf = np.exp(log_pmf)
+    return pmf / pmf.sum()
+
+
+def dist_json(vec):
+    return {str(k): float(p) for k, p in enumerate(vec)}
+
+
+def seed_fixture(conn, seasons=3, teams=16, rounds=27, rng=None):
+    """
+    Rebuild BENCH_SCHEMA with synthetic data: `seasons` seasons ending with
+    the current one, whose rounds straddle today so there are both finished
+    and upcoming matches. SGM bins are generated for current-season matches.
+    """
+    rng = rng or random.Random(0)
+    today = date.today()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+        with open(os.path.join(BENCH_DIR, 'schema.sql')) as f:
+            cur.execute(f.read())
+
+        team_ids = [row[0] for row in execute_values(
+            cur, "INSERT INTO teams (name) VALUES %s RETURNING id",
+            [(f"Team {i + 1}",) for i in range(teams)], fetch=True
+        )]
+        rosters = {}
+        for team_id in team_ids:
+            player_ids = [row[0] for row in execute_values(
+                cur, "INSERT INTO players (name) VALUES %s RETURNING id",
+                [(f"Player {team_id}-{j + 1}",) for j in range(len(POSITIONS))], fetch=True
+            )]
+            rosters[team_id] = list(zip(player_ids, POSITIONS, range(1, len(POSITIONS) + 1)))
+
+        team_list, player_stats, try_dists, sgm_bins = [], [], [], []
+        for offset in range(seasons - 1, -1, -1):
+            cur.execute("INSERT INTO seasons (year) VALUES (%s) RETURNING id", (today.year - offset,))
+            season_id = cur.fetchone()[0]
+            for round_number in range(1, rounds + 1):
+                start = today + timedelta(days=7 * (round_number - rounds // 2) - 364 * offset)
+                cur.execute(
+                    "INSERT INTO rounds (season_id, round_number, start_date) VALUES (%s, %s, %s) RETURNING id",
+                    (season_id, round_number, start)
+                )
+                round_id = cur.fetchone()[0]
+                order = team_ids[:]
+                rng.shuffle(order)
+                fixtures = []
+                for i in range(0, len(order) - 1, 2):
+                    finished = start < today
+                    kickoff = datetime.combine(start + timedelta(days=i // 4), datetime.min.time()) + timedelta(hours=19)
+                    fixtures.append((
+                        round_id, kickoff, order[i], order[i + 1], f"Stadium {order[i]}", finished,
+                        rng.randint(0, 40) if finished else None, rng.randint(0, 40) if finished else None
+                    ))
+                match_rows = execute_values(cur, """
+                    INSERT INTO matches (round_id, date, home_team_id, away_team_id, venue,
+                                         is_finished, home_score, away_score)
+                    VALUES %s RETURNING id, home_team_id, away_team_id, is_finished
+                """, fixtures, fetch=True)
+                for match_id, home_id, away_id, finished in match_rows:
+                    for team_id in (home_id, away_id):
+                        for player_id, position, jersey in rosters[team_id]:
+                            team_list.append((match_id, team_id, player_id, position, jersey <= 13, jersey))
+                            if finished and rng.random() < 0.9:
+                                rate = POSITION_TRY_RATE[position]
+                                tries = int(np.searchsorted(np.cumsum(poisson_dist(rate, 5)), rng.random()))
+                                player_stats.append((player_id, match_id, position, tries))
+                        try_dists.append((match_id, team_id, Json(dist_json(poisson_dist(rng.uniform(2.5, 5), 13)))))
+                    if offset == 0:
+                        for margin in range(-36, 37, 4):
+                            for total in range(8, 73, 4):
+                                home_tries = max(0.3, (total + margin) / 2 / 5)
+                                away_tries = max(0.3, (total - margin) / 2 / 5)
+                                sgm_bins.append((
+                                    match_id, margin, total,
+                                    Json(dist_json(poisson_dist(home_tries, 12))),
+                                    Json(dist_json(poisson_dist(away_tries, 12))),
+                                    rng.randint(1, 200)
+                                ))
+
+        execute_values(cur, """
+            INSERT INTO team_list (match_id, team_id, player_id, position, starter, jersey_number) VALUES %s
+        """, team_list, page_size=5000)
+        execute_values(cur, "INSERT INTO player_stats (player_id, match_id, position, tries) VALUES %s",
+                       player_stats, page_size=5000)
+        execute_values(cur, "INSERT INTO match_try_distributions (match_id, team_id, distribution) VALUES %s",
+                       try_dists, page_size=5000)
+        execute_values(cur, """
+            INSERT INTO match_sgm_bins (match_id, margin, total_points, home_try_dist, away_try_dist, count)
+            VALUES %s
+        """, sgm_bins, page_size=5000)
+
+        for name in sorted(os.listdir(os.path.join(REPO_DIR, 'migrations'))):
+            if name.endswith('.sql'):
+                with open(os.path.join(REPO_DIR, 'migrations', name)) as f:
+                    cur.execute(f.read())
+        cur.execute("ANALYZE")
+
+    runner = app.app.test_cli_runner()
+    for args in (['pack-try-dists'], ['refresh-try-rates', '--full'], ['build-price-board']):
+        result = runner.invoke(args=args)
+        if result.exit_code != 0:
+            raise RuntimeError(f"flask {' '.join(args)} failed: {result.output}") from result.exception
+
+
+def fixture_ids(conn):
+    """Match and team ids for the route cases: the next upcoming match with bins."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT m.id, m.home_team_id, m.away_team_id
+            FROM matches m
+            WHERE NOT m.is_finished AND EXISTS (SELECT 1 FROM match_sgm_bins b WHERE b.match_id = m.id)
+            ORDER BY m.date, m.id
+            LIMIT 4
+        """)
+        rows = cur.fetchall()
+    if not rows:
+        raise RuntimeError("fixture has no upcoming matches with SGM bins")
+    return rows
+
+
+def measure(fn, min_runs, min_time, max_runs=5000, setup=None):
+    """
+    Time fn() until it has run min_runs times and for at least min_time
+    seconds (capped at max_runs); setup(), if given, runs untimed before
+    each call. Returns per-call latencies in seconds and peak traced memory.
+    """
+    for _ in range(3):
+        if setup:
+            setup()
+        fn()
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_runs and (len(latencies) < min_runs or time.perf_counter() - started < min_time):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies), peak
+
+
+def summarise(latencies, peak):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "runs": int(len(latencies)),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "ops_per_s": float(len(latencies) / latencies.sum()),
+        "peak_kib": peak / 1024
+    }
+
+
+def engine_cases():
+    """(name, fn) pairs over a grid of K legs, min_tries and distribution lengths."""
+    rng = np.random.default_rng(0)
+    cases = []
+    for length in (8, 16, 32):
+        try_dist = dist_json(poisson_dist(length / 4, length))
+        for k in range(1, 11):
+            probs = list(rng.uniform(0.02, 0.5 / k, size=k))
+            for m in (1, 2):
+                mins = [m] * k
+                cases.append((f"engine:multinomial_at_least n={length - 1} K={k} m={m}",
+                              lambda n=length - 1, p=probs, mn=mins: app.multinomial_at_least(n, p, mn)))
+                cases.append((f"engine:joint_min_tries_probability len={length} K={k} m={m}",
+                              lambda d=try_dist, p=probs, mn=mins: app.joint_min_tries_probability(d, p, mn)))
+
+    try_dist = dist_json(poisson_dist(4, 16))
+    squad = list(rng.uniform(0.02, 0.12, size=17))
+    for size in (2, 3):
+        legs = [([squad[i] for i in combo], [1] * size) for combo in combinations(range(len(squad)), size)]
+        cases.append((f"engine:price_sgm_combinations len=16 {len(legs)}x{size}-leg",
+                       lambda l=legs: app.price_sgm_combinations(try_dist, l)))
+    for k in (4, 10):
+        probs = squad[:k]
+        cases.append((f"engine:simulate_min_tries_probability len=16 K={k}",
+                      lambda p=probs: app.simulate_min_tries_probability(try_dist, p, [1] * len(p))))
+    return cases
+
+
+def bins_cases(conn, match_id):
+    """SgmBinsIndex build, rectangle query and bin-conditioned pricing for one match."""
+    with conn.cursor(cursor_factory=app.RealDictCursor) as cur:
+        cur.execute("""
+            SELECT margin, total_points, count, home_try_dist_bin, away_try_dist_bin,
+                   NULL AS home_try_dist, NULL AS away_try_dist
+            FROM match_sgm_bins WHERE match_id = %s
+        """, (match_id,))
+        rows = cur.fetchall()
+    index = app.SgmBinsIndex(rows)
+    home = ([0.12, 0.08, 0.05], [1, 1, 1])
+    away = ([0.1, 0.06], [1, 2])
+
+    def price_uncached():
+        index._leg_cache.clear()
+        return index.price(home, away, margin_gte=1, margin_lte=12, total_lte=40)
+
+    return [
+        (f"engine:SgmBinsIndex build {len(rows)} bins", lambda: app.SgmBinsIndex(rows)),
+        ("engine:SgmBinsIndex.query margin 1..12", lambda: index.query(1, 12, None, None)),
+        ("engine:SgmBinsIndex.price 3+2 legs", price_uncached)
+    ]
+
+
+def clear_app_caches():
+    app.purge_response_cache()
+    app.invalidate_sgm_bins()
+    app.sgm_price_cache.clear()
+
+
+def route_requests(ids):
+    """(method, template, url, body) for one call to each route, with ids from fixture_ids."""
+    match_id, home_id, away_id = ids[0]
+    try_dist = dist_json(poisson_dist(4, 13))
+    calls = [
+        ('GET', '/api/upcoming_matches', None),
+        ('GET', '/api/upcoming_matches?limit=20', None),
+        ('GET', '/api/upcoming_matches?format=ndjson', None),
+        ('GET', '/api/current_round_matches', None),
+        ('GET', '/api/match_team_lists/{match_id}', None),
+        ('GET', '/api/match_team_lists?ids={match_ids}', None),
+        ('GET', '/api/player_try_probabilities/{match_id}/{home_id}', None),
+        ('GET', '/api/match_try_distribution/{match_id}/{away_id}', None),
+        ('GET', '/api/match_sgm_bins_range/{match_id}?margin_gte=1&margin_lte=12', None),
+        ('GET', '/api/match_sgm_bins_lines/{match_id}', None),
+        ('GET', '/api/match_bundle/{match_id}', None),
+        ('GET', '/api/match_price_board/{match_id}', None),
+        ('POST', '/api/sgm_probability',
+         {"try_dist": try_dist, "player_probs": [0.12, 0.08, 0.05], "min_tries": [1, 1, 1]}),
+        ('POST', '/api/sgm_probability/batch',
+         {"try_dist": try_dist, "combinations": [
+             {"player_probs": [0.12, p], "min_tries": [1, 1]} for p in np.linspace(0.02, 0.1, 17)
+         ]}),
+        ('POST', '/api/match_sgm_probability/{match_id}',
+         {"margin_gte": 1, "margin_lte": 12,
+          "home": {"player_probs": [0.12, 0.08], "min_tries": [1, 1]},
+          "away": {"player_probs": [0.1], "min_tries": [1]}})
+    ]
+    params = {
+        "match_id": match_id, "home_id": home_id, "away_id": away_id,
+        "match_ids": ','.join(str(row[0]) for row in ids)
+    }
+    return [(method, template, template.format(**params), body) for method, template, body in calls]
+
+
+def route_cases(ids):
+    """(name, fn, setup) for each route, cold (caches cleared every call) and warm."""
+    client = app.app.test_client()
+    cases = []
+    for method, template, url, body in route_requests(ids):
+        def call(method=method, url=url, body=body):
+            response = client.open(url, method=method, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.get_data(as_text=True)}")
+        # Cases are named by template so baselines survive a re-seed picking different ids
+        cases.append((f"route:{method} {template} cold", call, clear_app_caches))
+        cases.append((f"route:{method} {template} warm", call, None))
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """Names of cases whose p50 or p95 regressed by more than threshold (a fraction)."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if base[key] > 0 and stats[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {base[key]:.3f} -> {stats[key]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--engine-only', action='store_true', help='Skip the Postgres fixture and route cases.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the fixture from a previous run.')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this.')
+    parser.add_argument('--min-runs', type=int, default=30)
+    parser.add_argument('--min-time', type=float, default=0.2, help='Seconds to spend timing each case.')
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--teams', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=27)
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run to --baseline.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown before flagging (0.25 = 25%%).')
+    parser.add_argument('--json', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    cases = [(name, fn, None) for name, fn in engine_cases()]
+    if not args.engine_only:
+        conn = app.get_db_connection()
+        conn.autocommit = True
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed_fixture(conn, seasons=args.seasons, teams=args.teams, rounds=args.rounds)
+            print(f"seeded fixture in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        ids = fixture_ids(conn)
+        cases += [(name, fn, None) for name, fn in bins_cases(conn, ids[0][0])]
+        cases += route_cases(ids)
+        conn.close()
+
+    results = {}
+    print(f"{'case':<72} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'peak KiB':>9}")
+    for name, fn, setup in cases:
+        if args.filter not in name:
+            continue
+        stats = summarise(*measure(fn, args.min_runs, args.min_time, setup=setup))
+        results[name] = stats
+        print(f"{name:<72} {stats['runs']:>6} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+              f"{stats['p99_ms']:>9.3f} {stats['ops_per_s']:>10.1f} {stats['peak_kib']:>9.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"saved {len(results)} cases to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
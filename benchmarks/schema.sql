@@ -0,0 +1,73 @@
+-- Base tables for the benchmark fixture: the columns app.py reads, nothing more.
+-- migrations/ are applied on top of this by benchmarks/bench.py.
+CREATE TABLE seasons (
+    id SERIAL PRIMARY KEY,
+    year INTEGER NOT NULL
+);
+
+CREATE TABLE rounds (
+    id SERIAL PRIMARY KEY,
+    season_id INTEGER NOT NULL REFERENCES seasons (id),
+    round_number INTEGER NOT NULL,
+    start_date DATE NOT NULL
+);
+
+CREATE TABLE teams (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL
+);
+
+CREATE TABLE matches (
+    id SERIAL PRIMARY KEY,
+    round_id INTEGER NOT NULL REFERENCES rounds (id),
+    date TIMESTAMP NOT NULL,
+    home_team_id INTEGER NOT NULL REFERENCES teams (id),
+    away_team_id INTEGER NOT NULL REFERENCES teams (id),
+    venue TEXT,
+    is_finished BOOLEAN NOT NULL DEFAULT FALSE,
+    home_score INTEGER,
+    away_score INTEGER
+);
+
+CREATE TABLE players (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL
+);
+
+CREATE TABLE team_list (
+    id SERIAL PRIMARY KEY,
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    team_id INTEGER NOT NULL REFERENCES teams (id),
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    position TEXT NOT NULL,
+    starter BOOLEAN NOT NULL DEFAULT TRUE,
+    jersey_number INTEGER
+);
+CREATE INDEX ON team_list (match_id, team_id);
+
+CREATE TABLE player_stats (
+    id SERIAL PRIMARY KEY,
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    position TEXT,
+    tries INTEGER
+);
+
+CREATE TABLE match_try_distributions (
+    id SERIAL PRIMARY KEY,
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    team_id INTEGER NOT NULL REFERENCES teams (id),
+    distribution JSONB,
+    generated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX ON match_try_distributions (match_id, team_id);
+
+CREATE TABLE match_sgm_bins (
+    id SERIAL PRIMARY KEY,
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    margin INTEGER NOT NULL,
+    total_points INTEGER NOT NULL,
+    home_try_dist JSONB,
+    away_try_dist JSONB,
+    count INTEGER NOT NULL
+);
@@ -0,0 +1,289 @@
+"""
+Throughput and memory of the sync and gevent gunicorn workers under the same load.
+
+    python benchmarks/serve.py                      # seed the fixture, compare both modes
+    python benchmarks/serve.py --no-seed --db-latency 0.002 --upstream-latency 0.2
+    python benchmarks/serve.py --no-seed --modes gevent --concurrency 64
+
+Each mode starts `gunicorn app:app` on the benchmark fixture (see bench.py)
+with the same number of workers. Every --concurrency client thread then cycles
+through bench.route_requests for --duration seconds after a warm-up. nrl.com
+is replaced by a local stub that answers after --upstream-latency seconds, and
+--db-latency routes Postgres through a local proxy that delays each round
+trip, so routes wait on I/O as they would against remote services.
+
+Each mode reports requests/s, latency percentiles, errors, and the peak
+resident memory summed over the gunicorn master, its workers and their
+pricing processes, sampled every 0.2s. The client shares the machine with the
+server, so compare modes within one run rather than across machines.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+import bench
+
+
+class StubNrl(BaseHTTPRequestHandler):
+    """nrl.com stand-in: an empty current round after `latency` seconds."""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({"selectedRoundId": 1, "fixtures": []}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def postgres_address():
+    """Where the PG* environment points: a unix socket path or a (host, port) pair."""
+    host = os.environ.get('PGHOST') or '/var/run/postgresql'
+    port = int(os.environ.get('PGPORT') or 5432)
+    return f'{host}/.s.PGSQL.{port}' if host.startswith('/') else (host, port)
+
+
+class LatencyProxy(socketserver.ThreadingTCPServer):
+    """
+    TCP proxy to Postgres that holds every chunk of server output for
+    `latency` seconds, adding one delay per query round trip as a remote
+    database would.
+    """
+    daemon_threads = True
+
+    def __init__(self, target, latency):
+        self.target = target
+        self.latency = latency
+        super().__init__(('127.0.0.1', 0), LatencyProxyHandler)
+
+
+class LatencyProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        family = socket.AF_UNIX if isinstance(self.server.target, str) else socket.AF_INET
+        upstream = socket.socket(family, socket.SOCK_STREAM)
+        upstream.connect(self.server.target)
+
+        def pump(source, sink, delay):
+            try:
+                while True:
+                    chunk = source.recv(65536)
+                    if not chunk:
+                        break
+                    if delay:
+                        time.sleep(delay)
+                    sink.sendall(chunk)
+            except OSError:
+                pass
+            finally:
+                for sock in (source, sink):
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+        to_server = threading.Thread(target=pump, args=(self.request, upstream, 0), daemon=True)
+        to_server.start()
+        pump(upstream, self.request, self.server.latency)
+        to_server.join()
+        upstream.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(root_pid):
+    """Summed VmRSS in bytes of root_pid and all its descendants, and how many processes that is."""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # the command name may contain spaces; ppid is the second field after it
+                parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = {root_pid}, [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        children = [child for child, parent in parents.items() if parent == pid]
+        tree.update(children)
+        frontier.extend(children)
+    rss = 0
+    for pid in tree:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                rss += next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            continue
+    return rss, len(tree)
+
+
+def start_server(mode, args, port, upstream_url, db_address):
+    env = dict(
+        os.environ, NRL_BASE_URL=upstream_url, NRL_POLLER='0', UPSTREAM_CACHE_BACKEND='memory', LOG_LEVEL='WARNING'
+    )
+    if args.pricing_processes is not None:
+        env['SGM_PRICING_PROCESSES'] = str(args.pricing_processes)
+    else:
+        env.pop('SGM_PRICING_PROCESSES', None)  # bench.py sets 0; use the app's per-mode default
+    if db_address:
+        env.update(PGHOST=db_address[0], PGPORT=str(db_address[1]))
+    command = [
+        sys.executable, '-m', 'gunicorn', '--chdir', bench.REPO_DIR, '-b', f'127.0.0.1:{port}',
+        '-w', str(args.workers), '-k', mode, '--log-level', 'warning'
+    ]
+    if mode == 'gevent':
+        command += ['--worker-connections', str(args.worker_connections)]
+    server = subprocess.Popen(command + ['app:app'], env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/api/upcoming_matches?limit=1', timeout=5)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"gunicorn ({mode}) did not come up on port {port}")
+
+
+def drive(base_url, calls, concurrency, duration):
+    """Run `concurrency` client threads over `calls` for `duration` seconds; returns latencies and error count."""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    stop_at = time.perf_counter() + duration
+
+    def client(slot):
+        session = requests.Session()
+        i = slot
+        while time.perf_counter() < stop_at:
+            method, _, url, body = calls[i % len(calls)]
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                ok = session.request(method, base_url + url, json=body, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            latencies[slot].append(time.perf_counter() - t0)
+            errors[slot] += not ok
+
+    threads = [threading.Thread(target=client, args=(slot,)) for slot in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.concatenate([np.array(l) for l in latencies]), sum(errors), time.perf_counter() - started
+
+
+def run_mode(mode, args, calls, upstream_url, db_address):
+    port = free_port()
+    server = start_server(mode, args, port, upstream_url, db_address)
+    peak = {"rss": 0, "processes": 0}
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(0.2):
+            rss, processes = process_tree_rss(server.pid)
+            if rss > peak["rss"]:
+                peak.update(rss=rss, processes=processes)
+
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        drive(base_url, calls, args.concurrency, args.warmup)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        latencies, errors, elapsed = drive(base_url, calls, args.concurrency, args.duration)
+        sampling.set()
+        sampler.join()
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "requests": int(len(latencies)),
+        "errors": int(errors),
+        "req_per_s": len(latencies) / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "peak_rss_mib": peak["rss"] / 2 ** 20,
+        "processes": peak["processes"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--modes', default='sync,gevent', help='Comma-separated gunicorn worker classes to compare.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-connections', type=int, default=100, help='Greenlets per gevent worker.')
+    parser.add_argument('--pricing-processes', type=int,
+                        help="SGM_PRICING_PROCESSES for every mode (default: the app's, 0 for sync and 1 for gevent).")
+    parser.add_argument('--concurrency', type=int, default=32, help='Client threads.')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to measure each mode.')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds of unmeasured load first.')
+    parser.add_argument('--upstream-latency', type=float, default=0.1, help='Seconds the stub nrl.com takes to answer.')
+    parser.add_argument('--db-latency', type=float, default=0.0,
+                        help='Seconds added to every Postgres round trip by a local proxy, as for a remote server.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the fixture from a previous bench.py run.')
+    parser.add_argument('--json', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    conn = bench.app.get_db_connection()
+    conn.autocommit = True
+    if not args.no_seed:
+        started = time.perf_counter()
+        bench.seed_fixture(conn)
+        print(f"seeded fixture in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    calls = bench.route_requests(bench.fixture_ids(conn))
+    conn.close()
+
+    StubNrl.latency = args.upstream_latency
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), StubNrl)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f'http://127.0.0.1:{upstream.server_port}'
+
+    db_address = None
+    if args.db_latency > 0:
+        proxy = LatencyProxy(postgres_address(), args.db_latency)
+        threading.Thread(target=proxy.serve_forever, daemon=True).start()
+        db_address = proxy.server_address
+
+    results = {}
+    print(f"{'mode':<8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'peak RSS MiB':>13} {'procs':>6}")
+    for mode in args.modes.split(','):
+        stats = results[mode] = run_mode(mode, args, calls, upstream_url, db_address)
+        print(f"{mode:<8} {stats['requests']:>9} {stats['errors']:>7} {stats['req_per_s']:>8.1f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} "
+              f"{stats['peak_rss_mib']:>13.1f} {stats['processes']:>6}")
+    upstream.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    return 1 if any(stats['errors'] for stats in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
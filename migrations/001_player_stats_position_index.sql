@@ -0,0 +1,4 @@
+-- Supports the grouped per-player aggregation in /api/player_try_probabilities:
+-- player_stats is probed by (player_id, position) and joined to matches on match_id.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_player_stats_player_position_match
+    ON player_stats (player_id, position, match_id);
@@ -0,0 +1,39 @@
+-- Materialised per-player, per-position try rates over the last two seasons.
+-- Read by /api/player_try_probabilities; maintained by `flask refresh-try-rates`.
+CREATE TABLE IF NOT EXISTS player_position_try_rates (
+    player_id INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    tries INTEGER NOT NULL,
+    matches_played INTEGER NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (player_id, position)
+);
+
+-- Single-row record of the season window the table was built for.
+CREATE TABLE IF NOT EXISTS try_rate_refresh_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    season_ids INTEGER[] NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Matches that finished since the last refresh.
+CREATE TABLE IF NOT EXISTS try_rate_refresh_queue (
+    match_id INTEGER PRIMARY KEY,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION queue_try_rate_refresh() RETURNS trigger AS $$
+BEGIN
+    IF NEW.is_finished AND (TG_OP = 'INSERT' OR NOT COALESCE(OLD.is_finished, FALSE)) THEN
+        INSERT INTO try_rate_refresh_queue (match_id) VALUES (NEW.id)
+        ON CONFLICT (match_id) DO NOTHING;
+        PERFORM pg_notify('try_rate_refresh', NEW.id::text);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS matches_queue_try_rate_refresh ON matches;
+CREATE TRIGGER matches_queue_try_rate_refresh
+    AFTER INSERT OR UPDATE OF is_finished ON matches
+    FOR EACH ROW EXECUTE FUNCTION queue_try_rate_refresh();
@@ -0,0 +1,3 @@
+-- Lets /api/match_sgm_bins_range filter margin/total ranges for one match from the index.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_match_sgm_bins_match_margin_total
+    ON match_sgm_bins (match_id, margin, total_points);
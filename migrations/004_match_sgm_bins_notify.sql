@@ -0,0 +1,23 @@
+-- Announce SGM bin regeneration so workers drop their cached summed-area tables.
+CREATE OR REPLACE FUNCTION notify_sgm_bins_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('sgm_bins_changed', '');
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('sgm_bins_changed', OLD.match_id::text);
+    ELSE
+        PERFORM pg_notify('sgm_bins_changed', NEW.match_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS match_sgm_bins_notify ON match_sgm_bins;
+CREATE TRIGGER match_sgm_bins_notify
+    AFTER INSERT OR UPDATE OR DELETE ON match_sgm_bins
+    FOR EACH ROW EXECUTE FUNCTION notify_sgm_bins_changed();
+
+DROP TRIGGER IF EXISTS match_sgm_bins_notify_truncate ON match_sgm_bins;
+CREATE TRIGGER match_sgm_bins_notify_truncate
+    AFTER TRUNCATE ON match_sgm_bins
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_sgm_bins_changed();
@@ -0,0 +1,53 @@
+-- Packed try distributions: little-endian float64 arrays indexed by try count
+-- (NaN = try count absent). Readers prefer these and fall back to the JSON
+-- columns while they are NULL. Triggers below keep them in step with the JSON;
+-- backfill rows written before this migration with `flask pack-try-dists`.
+ALTER TABLE match_try_distributions ADD COLUMN IF NOT EXISTS distribution_bin BYTEA;
+ALTER TABLE match_sgm_bins ADD COLUMN IF NOT EXISTS home_try_dist_bin BYTEA;
+ALTER TABLE match_sgm_bins ADD COLUMN IF NOT EXISTS away_try_dist_bin BYTEA;
+
+-- Same encoding as app.pack_try_dist, so rows written by anything other than
+-- the app are packed too. NULL in, NULL out.
+CREATE OR REPLACE FUNCTION pack_try_dist(dist JSONB) RETURNS BYTEA AS $$
+    SELECT CASE WHEN dist IS NOT NULL THEN COALESCE((
+        SELECT string_agg(
+            (SELECT string_agg(substring(f.be FROM i FOR 1), ''::bytea ORDER BY i DESC)
+             FROM generate_series(1, 8) AS i),
+            ''::bytea ORDER BY n
+        )
+        FROM generate_series(0, (SELECT max(key::integer) FROM jsonb_object_keys(dist) AS key)) AS n,
+             LATERAL (SELECT float8send(COALESCE((dist ->> n::text)::double precision, 'NaN'))) AS f(be)
+    ), ''::bytea) END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Repack whenever the JSON is written so the *_bin columns never go stale.
+CREATE OR REPLACE FUNCTION pack_match_try_distribution() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.distribution IS DISTINCT FROM OLD.distribution THEN
+        NEW.distribution_bin := pack_try_dist(NEW.distribution);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS match_try_distributions_pack ON match_try_distributions;
+CREATE TRIGGER match_try_distributions_pack
+    BEFORE INSERT OR UPDATE OF distribution ON match_try_distributions
+    FOR EACH ROW EXECUTE FUNCTION pack_match_try_distribution();
+
+CREATE OR REPLACE FUNCTION pack_match_sgm_bin() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.home_try_dist IS DISTINCT FROM OLD.home_try_dist THEN
+        NEW.home_try_dist_bin := pack_try_dist(NEW.home_try_dist);
+    END IF;
+    IF TG_OP = 'INSERT' OR NEW.away_try_dist IS DISTINCT FROM OLD.away_try_dist THEN
+        NEW.away_try_dist_bin := pack_try_dist(NEW.away_try_dist);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS match_sgm_bins_pack ON match_sgm_bins;
+CREATE TRIGGER match_sgm_bins_pack
+    BEFORE INSERT OR UPDATE OF home_try_dist, away_try_dist ON match_sgm_bins
+    FOR EACH ROW EXECUTE FUNCTION pack_match_sgm_bin();
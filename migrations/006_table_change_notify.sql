@@ -0,0 +1,25 @@
+-- Announce changes to tables behind cached API responses (payload = table name).
+CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY[
+        'seasons', 'rounds', 'teams', 'matches', 'players', 'team_list',
+        'match_try_distributions', 'match_sgm_bins'
+    ] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_notify_changed', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()',
+            t || '_notify_changed', t
+        );
+    END LOOP;
+END;
+$$;
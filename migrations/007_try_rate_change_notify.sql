@@ -0,0 +1,15 @@
+-- /api/match_bundle also caches try probabilities, so announce changes to their sources.
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['player_stats', 'player_position_try_rates'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_notify_changed', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()',
+            t || '_notify_changed', t
+        );
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,66 @@
+-- Precomputed tryscorer prices per named player (anytime, 2+, 3+) and for
+-- same-team pairs both scoring. Read by /api/match_price_board; built by
+-- `flask build-price-board` for the current round and any queued matches.
+CREATE TABLE IF NOT EXISTS tryscorer_price_board (
+    match_id INTEGER NOT NULL,
+    team_id INTEGER NOT NULL,
+    player_id INTEGER NOT NULL,
+    try_share DOUBLE PRECISION NOT NULL,
+    p_1plus DOUBLE PRECISION NOT NULL,
+    p_2plus DOUBLE PRECISION NOT NULL,
+    p_3plus DOUBLE PRECISION NOT NULL,
+    built_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (match_id, player_id)
+);
+
+CREATE TABLE IF NOT EXISTS tryscorer_pair_board (
+    match_id INTEGER NOT NULL,
+    team_id INTEGER NOT NULL,
+    player_id INTEGER NOT NULL,
+    other_player_id INTEGER NOT NULL,
+    p_both DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (match_id, player_id, other_player_id)
+);
+
+-- Matches whose team lists or try distributions changed since their board was built.
+CREATE TABLE IF NOT EXISTS price_board_queue (
+    match_id INTEGER PRIMARY KEY,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION queue_price_board() RETURNS trigger AS $$
+DECLARE
+    changed INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.match_id ELSE NEW.match_id END;
+BEGIN
+    INSERT INTO price_board_queue (match_id) VALUES (changed)
+    ON CONFLICT (match_id) DO NOTHING;
+    PERFORM pg_notify('price_board_refresh', changed::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS team_list_queue_price_board ON team_list;
+CREATE TRIGGER team_list_queue_price_board
+    AFTER INSERT OR UPDATE OR DELETE ON team_list
+    FOR EACH ROW EXECUTE FUNCTION queue_price_board();
+
+DROP TRIGGER IF EXISTS match_try_distributions_queue_price_board ON match_try_distributions;
+CREATE TRIGGER match_try_distributions_queue_price_board
+    AFTER INSERT OR UPDATE OR DELETE ON match_try_distributions
+    FOR EACH ROW EXECUTE FUNCTION queue_price_board();
+
+-- The board endpoint is behind the response cache, so announce rebuilds.
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['tryscorer_price_board', 'tryscorer_pair_board'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_notify_changed', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()',
+            t || '_notify_changed', t
+        );
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,3 @@
+-- Keyset pagination for /api/upcoming_matches: unfinished matches in (date, id) order.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_upcoming_date_id
+    ON matches (date, id) WHERE is_finished = FALSE;
@@ -0,0 +1,28 @@
+-- Stats for a finished match usually land after is_finished flips, so queue
+-- the match again when its player_stats change. A player moved off a match
+-- (row deleted or re-pointed) no longer shows up in its rows, so queue them
+-- by id too.
+CREATE TABLE IF NOT EXISTS try_rate_player_queue (
+    player_id INTEGER PRIMARY KEY,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION queue_try_rate_refresh_for_stats() RETURNS trigger AS $$
+DECLARE
+    changed INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.match_id ELSE NEW.match_id END;
+BEGIN
+    INSERT INTO try_rate_refresh_queue (match_id) VALUES (changed)
+    ON CONFLICT (match_id) DO NOTHING;
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.player_id IS DISTINCT FROM NEW.player_id) THEN
+        INSERT INTO try_rate_player_queue (player_id) VALUES (OLD.player_id)
+        ON CONFLICT (player_id) DO NOTHING;
+    END IF;
+    PERFORM pg_notify('try_rate_refresh', changed::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS player_stats_queue_try_rate_refresh ON player_stats;
+CREATE TRIGGER player_stats_queue_try_rate_refresh
+    AFTER INSERT OR UPDATE OR DELETE ON player_stats
+    FOR EACH ROW EXECUTE FUNCTION queue_try_rate_refresh_for_stats();
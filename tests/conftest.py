@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The app reads its configuration at import time; keep tests off the network,
+# the pricing pool and the database listener.
+os.environ.setdefault('NRL_POLLER', '0')
+os.environ.setdefault('DB_LISTEN', '0')
+os.environ.setdefault('SGM_PRICING_PROCESSES', '0')
+os.environ.setdefault('UPSTREAM_CACHE_BACKEND', 'memory')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
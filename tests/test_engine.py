@@ -0,0 +1,196 @@
+import itertools
+import math
+import random
+import tracemalloc
+
+import pytest
+
+import app
+
+
+def brute_force_at_least(n, probs, mins):
+    """P(X_i >= mins[i] for all i) by enumerating every multinomial outcome."""
+    p_other = 1.0 - sum(probs)
+    total = 0.0
+    for counts in itertools.product(range(n + 1), repeat=len(probs)):
+        rest = n - sum(counts)
+        if rest < 0 or any(c < m for c, m in zip(counts, mins)):
+            continue
+        coef = math.factorial(n) // math.factorial(rest)
+        prob = p_other ** rest
+        for c, p in zip(counts, probs):
+            coef //= math.factorial(c)
+            prob *= p ** c
+        total += coef * prob
+    return total
+
+
+@pytest.mark.parametrize('k', range(1, 6))
+def test_multinomial_at_least_matches_brute_force(k):
+    rng = random.Random(k)
+    for _ in range(20):
+        n = rng.randint(0, 10)
+        probs = [rng.uniform(0.01, 0.9 / k) for _ in range(k)]
+        mins = [rng.randint(0, 3) for _ in range(k)]
+        assert app.multinomial_at_least(n, probs, mins) == pytest.approx(
+            brute_force_at_least(n, probs, mins), abs=1e-12
+        )
+
+
+def test_joint_min_tries_probability_weights_try_counts():
+    try_dist = {"0": 0.1, "1": 0.2, "2": 0.3, "3": 0.25, "4": 0.15}
+    probs, mins = [0.3, 0.2, 0.1], [1, 1, 0]
+    expected = sum(p * brute_force_at_least(int(n), probs, mins) for n, p in try_dist.items())
+    assert app.joint_min_tries_probability(try_dist, probs, mins) == pytest.approx(expected, abs=1e-12)
+
+
+def test_batch_pricing_matches_single_pricing():
+    try_dist = {str(n): p for n, p in enumerate([0.05, 0.15, 0.3, 0.3, 0.15, 0.05])}
+    combos = [([0.2, 0.1], [1, 1]), ([0.1, 0.2], [1, 1]), ([0.2, 0.1, 0.05], [1, 2, 1]), ([0.3], [2])]
+    batch = app.price_sgm_combinations(try_dist, combos)
+    for (probs, mins), price in zip(combos, batch):
+        assert price == pytest.approx(app.joint_min_tries_probability(try_dist, probs, mins), abs=1e-13)
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/sgm_probability', {"try_dist": {"1100": 1}, "player_probs": [0.1], "min_tries": [1]}),
+    ('/api/sgm_probability', {"try_dist": {"2": "x"}, "player_probs": [0.1], "min_tries": [1]}),
+    ('/api/sgm_probability/batch', {"try_dist": {"2000": 1},
+                                    "combinations": [{"player_probs": [0.1], "min_tries": [1]}]}),
+])
+def test_oversized_or_malformed_try_dist_is_rejected(path, body):
+    response = app.app.test_client().post(path, json=body)
+    assert response.status_code == 400
+    assert app.binomial_tables.cache_info().currsize <= app.binomial_tables.cache_info().maxsize
+
+
+def test_binomial_tables_refuse_uncapped_sizes():
+    with pytest.raises(ValueError):
+        app.binomial_tables(app.SGM_MAX_TRY_COUNT + 1)
+
+
+def test_simulation_standard_error_covers_rare_selections():
+    # Exact price ~7e-8: a plug-in standard error would be 0 after one batch of misses
+    try_dist = {str(n): p for n, p in enumerate([0.02, 0.08, 0.15, 0.2, 0.2, 0.15, 0.1, 0.06, 0.04])}
+    probs, mins = [0.02] * 6, [1] * 6
+    exact = app.joint_min_tries_probability(try_dist, probs, mins)
+    prob, se, samples = app.simulate_min_tries_probability(try_dist, probs, mins, target_se=1e-3)
+    assert se > 0
+    assert abs(prob - exact) <= 3 * se
+
+
+def test_simulation_matches_exact_within_standard_error():
+    try_dist = {str(n): p for n, p in enumerate([0.05, 0.15, 0.3, 0.3, 0.15, 0.05])}
+    probs, mins = [0.3, 0.2, 0.1], [1, 1, 1]
+    exact = app.joint_min_tries_probability(try_dist, probs, mins)
+    prob, se, samples = app.simulate_min_tries_probability(try_dist, probs, mins, target_se=1e-3)
+    assert se <= 1e-3
+    assert abs(prob - exact) <= 4 * se
+
+
+@pytest.mark.parametrize('home', [
+    {"player_probs": ["0.2"], "min_tries": [1]},
+    {"player_probs": [None], "min_tries": [1]},
+    {"player_probs": [1.5], "min_tries": [1]},
+    {"player_probs": [-0.1], "min_tries": [1]},
+    {"player_probs": [0.6, 0.5], "min_tries": [1, 1]},
+    {"player_probs": [0.2], "min_tries": [1.5]},
+    {"player_probs": [0.2], "min_tries": [1, 1]},
+    {"player_probs": 0.2, "min_tries": 1},
+])
+def test_match_sgm_probability_rejects_invalid_legs(home):
+    response = app.app.test_client().post('/api/match_sgm_probability/1', json={"home": home})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('combo', [
+    {"player_probs": ["a"], "min_tries": [1]},
+    {"player_probs": [0.2], "min_tries": ["x"]},
+    {"player_probs": 0.2, "min_tries": [1]},
+    {"player_probs": [0.7, 0.6], "min_tries": [1, 1]},
+    {"player_probs": [0.2], "min_tries": [1.5]},
+])
+def test_batch_rejects_invalid_combinations(combo):
+    body = {"try_dist": {"0": 0.2, "1": 0.5, "2": 0.3},
+            "combinations": [{"player_probs": [0.2], "min_tries": [1]}, combo]}
+    response = app.app.test_client().post('/api/sgm_probability/batch', json=body)
+    assert response.status_code == 400
+    assert 'index 1' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('legs', [
+    {"player_probs": [0.3], "min_tries": [1.5]},
+    {"player_probs": ["0.3"], "min_tries": [1]},
+    {"player_probs": [0.3], "min_tries": ["1"]},
+    {"player_probs": [0.7, 0.6], "min_tries": [1, 1]},
+])
+def test_single_rejects_invalid_legs(legs):
+    body = dict(legs, try_dist={"0": 0.2, "1": 0.5, "2": 0.3})
+    assert app.app.test_client().post('/api/sgm_probability', json=body).status_code == 400
+
+
+def test_float_min_tries_cannot_poison_the_price_cache():
+    client = app.app.test_client()
+    body = {"try_dist": {"0": 0.1, "1": 0.4, "2": 0.3, "3": 0.2}, "player_probs": [0.37], "min_tries": [1]}
+    app.sgm_price_cache.clear()
+    before = client.post('/api/sgm_probability', json=body).get_json()['probability']
+    client.post('/api/sgm_probability', json=dict(body, min_tries=[1.5]))
+    after = client.post('/api/sgm_probability', json=body).get_json()['probability']
+    assert after == before == pytest.approx(app.joint_min_tries_probability(body['try_dist'], [0.37], [1]))
+
+
+def test_simulation_memory_is_bounded_for_many_legs():
+    try_dist = {str(n): p for n, p in enumerate([0.05, 0.15, 0.3, 0.3, 0.15, 0.05])}
+    k = 4000
+    tracemalloc.start()
+    try:
+        prob, se, samples = app.simulate_min_tries_probability(try_dist, [0.2 / k] * k, [1] + [0] * (k - 1))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 2 ** 20
+    assert samples * (k + 1) <= app.SGM_SIM_MAX_CELLS
+
+
+@pytest.mark.parametrize('body', [
+    {"player_probs": [-0.1], "min_tries": [1]},
+    {"player_probs": ["x"], "min_tries": [1]},
+    {"player_probs": [0.2], "min_tries": [1.5]},
+    {"player_probs": [0.2], "min_tries": [-1]},
+    {"player_probs": [0.2], "min_tries": [1], "seed": -1},
+    {"player_probs": [0.2], "min_tries": [1], "target_se": 0},
+])
+def test_simulate_rejects_invalid_input(body):
+    body = dict(body, try_dist={"0": 0.2, "1": 0.5, "2": 0.3}, mode='simulate')
+    assert app.app.test_client().post('/api/sgm_probability', json=body).status_code == 400
+
+
+def bins_index(n_tries):
+    dist = {str(n): 1.0 / (n_tries + 1) for n in range(n_tries + 1)}
+    rows = [
+        {"margin": margin, "total_points": total, "count": 10,
+         "home_try_dist": dist, "away_try_dist": dist, "home_try_dist_bin": None, "away_try_dist_bin": None}
+        for margin in (-6, 6) for total in (30, 40)
+    ]
+    return app.SgmBinsIndex(rows)
+
+
+@pytest.mark.parametrize('n_tries, home', [
+    (150, {"player_probs": [0.0] * 5000, "min_tries": [0] * 5000}),
+    (app.SGM_MAX_TRY_COUNT + 100, {"player_probs": [0.1], "min_tries": [1]}),
+])
+def test_match_sgm_probability_applies_the_work_limit(monkeypatch, n_tries, home):
+    monkeypatch.setattr(app, 'get_sgm_bins_index', lambda match_id: bins_index(n_tries))
+    response = app.app.test_client().post('/api/match_sgm_probability/1', json={"home": home})
+    assert response.status_code == 422
+
+
+def test_match_sgm_probability_prices_within_the_limit(monkeypatch):
+    monkeypatch.setattr(app, 'get_sgm_bins_index', lambda match_id: bins_index(8))
+    body = {"margin_gte": 1, "home": {"player_probs": [0.2], "min_tries": [1]}}
+    response = app.app.test_client().post('/api/match_sgm_probability/1', json=body)
+    assert response.status_code == 200
+    dist = {str(n): 1 / 9 for n in range(9)}
+    assert response.get_json()['conditional_probability'] == pytest.approx(
+        app.joint_min_tries_probability(dist, [0.2], [1])
+    )
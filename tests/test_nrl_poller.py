@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+
+class StubNrl(BaseHTTPRequestHandler):
+    """nrl.com stand-in: serves `draw` with an ETag and answers 304 to a matching If-None-Match."""
+    protocol_version = 'HTTP/1.1'
+    draw = {}
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(self.draw).encode()
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def nrl_server():
+    StubNrl.requests = []
+    StubNrl.draw = {
+        "selectedRoundId": 7,
+        "fixtures": [{
+            "matchMode": "Post",
+            "homeTeam": {"nickName": "Sea Eagles", "score": 10},
+            "awayTeam": {"nickName": "Broncos", "score": 12},
+            "clock": {"kickOffTimeLong": "2020-01-01T00:00:00Z"}
+        }]
+    }
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubNrl)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ingested(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, 'ingest_round_draw', lambda *args: calls.append(args))
+    return calls
+
+
+class StopPolling(BaseException):
+    """Raised into NrlDrawPoller.run to end it, as run() only survives Exception."""
+
+
+def make_poller(base_url, **kwargs):
+    cache = app.SharedCache(app.LocalCacheBackend())
+    return app.NrlDrawPoller(app.NrlDrawClient(base_url=base_url), cache, **kwargs)
+
+
+def test_conditional_get_reuses_payload_on_304(nrl_server):
+    client = app.NrlDrawClient(base_url=nrl_server)
+    first = client.get_json('/draw/data')
+    second = client.get_json('/draw/data')
+    assert second == first
+    assert [etag for _, etag in StubNrl.requests] == [None, '"v1"']
+    assert client.not_modified == 1
+
+
+def test_poll_once_publishes_round_and_ingests(nrl_server, ingested):
+    poller = make_poller(nrl_server, live_interval=30, idle_interval=600)
+    assert poller.poll_once() == 600
+    assert poller.cache.backend.get('current_round')['value'] == [time.localtime().tm_year, 7]
+    assert poller.poll_once() == 600
+    assert poller.client.not_modified == 1
+    assert len(ingested) == 2 and ingested[1][2] == StubNrl.draw
+
+    StubNrl.draw["fixtures"][0]["matchMode"] = "Live"
+    StubNrl.etag = '"v2"'
+    try:
+        assert poller.poll_once() == 30
+    finally:
+        StubNrl.etag = '"v1"'
+
+
+def test_poll_once_backs_off_on_upstream_errors(ingested):
+    poller = make_poller('http://127.0.0.1:9', live_interval=30, max_interval=100)
+    assert poller.poll_once() == 60
+    assert poller.poll_once() == 100
+    assert not ingested
+
+
+def test_run_survives_errors_outside_poll_once(nrl_server, ingested, monkeypatch):
+    poller = make_poller(nrl_server, live_interval=0.01, idle_interval=0.01, max_interval=0.02)
+    puts = []
+    stop = threading.Event()
+
+    def flaky_put(key, value):
+        if stop.is_set():
+            raise StopPolling
+        puts.append(key)
+        if len(puts) == 1:
+            raise OSError("No space left on device")
+
+    def run():
+        try:
+            poller.run()
+        except StopPolling:
+            pass
+
+    monkeypatch.setattr(poller.cache, 'put', flaky_put)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.time() + 5
+    while len(ingested) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    alive = thread.is_alive()
+    stop.set()
+    thread.join(5)
+    assert alive
+    assert len(puts) >= 2 and len(ingested) >= 2
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize('after', [
+    '2026-10-17T19:30:00,42',
+    'Sat, 17 Oct 2026 19:30:00 GMT,42',
+])
+def test_keyset_after_accepts_iso_and_http_dates(after):
+    with app.app.test_request_context('/api/upcoming_matches', query_string={'after': after}):
+        assert app.keyset_args() == ((datetime(2026, 10, 17, 19, 30), 42), None)
+
+
+def test_keyset_after_round_trips_serialised_rows():
+    date = datetime(2026, 10, 17, 19, 30)
+    row = app.app.json.loads(app.app.json.dumps({"date": date, "match_id": 42}))
+    with app.app.test_request_context(query_string={'after': f"{row['date']},{row['match_id']}"}):
+        assert app.keyset_args()[0] == (date, 42)
+
+
+@pytest.mark.parametrize('after', ['tomorrow,42', '2026-10-17T19:30:00', 'Sat, 17 Oct 2026 19:30:00 GMT,x'])
+def test_keyset_after_rejects_malformed_cursors(after):
+    with app.app.test_request_context(query_string={'after': after}):
+        with pytest.raises(ValueError):
+            app.keyset_args()
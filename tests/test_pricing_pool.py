@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app
+
+pytest.importorskip('gevent')
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: monkey.patch_all() has to happen before anything
+# imports threading, which pytest already has.
+GEVENT_CLIENT = """
+from gevent import monkey
+monkey.patch_all()
+import json
+import gevent
+import app
+
+client = app.app.test_client()
+try_dist = {"0": 0.1, "1": 0.3, "2": 0.4, "3": 0.2}
+jobs = [
+    gevent.spawn(client.post, '/api/sgm_probability',
+                 json={"try_dist": try_dist, "player_probs": [0.2, 0.1 + i / 100], "min_tries": [1, 1]})
+    for i in range(4)
+] + [
+    gevent.spawn(client.post, '/api/sgm_probability/batch',
+                 json={"try_dist": try_dist, "combinations": [{"player_probs": [0.2], "min_tries": [1]}]})
+]
+gevent.joinall(jobs, raise_error=True)
+print(json.dumps([[job.value.status_code, job.value.get_json()] for job in jobs]))
+"""
+
+
+def test_pricing_pool_under_gevent():
+    env = dict(
+        os.environ, PYTHONPATH=REPO, SGM_PRICING_PROCESSES='1', SGM_INLINE_WORK='0', NRL_POLLER='0', DB_LISTEN='0',
+        UPSTREAM_CACHE_BACKEND='memory'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', GEVENT_CLIENT], env=env, cwd=REPO, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    responses = json.loads(result.stdout.strip().splitlines()[-1])
+    assert [status for status, _ in responses] == [200] * 5
+    try_dist = {"0": 0.1, "1": 0.3, "2": 0.4, "3": 0.2}
+    for i, (_, body) in enumerate(responses[:4]):
+        expected = app.joint_min_tries_probability(try_dist, [0.2, 0.1 + i / 100], [1, 1])
+        assert body["probability"] == pytest.approx(expected, abs=1e-12)
+    assert responses[4][1]["probabilities"] == [pytest.approx(app.joint_min_tries_probability(try_dist, [0.2], [1]))]
@@ -0,0 +1,71 @@
+import copy
+import random
+
+import app
+
+
+def legacy_order_nrl_team_list(players):
+    """The pre-bucketing implementation, kept as the reference ordering."""
+    pos_map = {
+        'FB': 'Fullback', 'Fullback': 'Fullback',
+        'WG': 'Wing', 'Wing': 'Wing',
+        'CE': 'Centre', 'Centre': 'Centre',
+        'FE': 'Five-eighth', 'Five-eighth': 'Five-eighth',
+        'HB': 'Halfback', 'Halfback': 'Halfback',
+        'PR': 'Front row', 'Front row': 'Front row',
+        'HK': 'Hooker', 'Hooker': 'Hooker',
+        'SR': 'Second row', 'Second row': 'Second row',
+        'LK': 'Lock', 'Lock': 'Lock',
+        'Interchange': 'Bench', 'Bench': 'Bench', 'Reserve': 'Bench'
+    }
+    for p in players:
+        p['norm_pos'] = pos_map.get(p['position'], p['position'])
+    used_players = set()
+    result = []
+
+    def pick(norm_pos, end):
+        candidates = [p for p in players if p['norm_pos'] == norm_pos and p['id'] not in used_players]
+        candidates = [p for p in candidates if p['jersey_number'] is not None]
+        if not candidates:
+            return None
+        key = lambda x: x['jersey_number']
+        target = min(candidates, key=key) if end == 'min' else max(candidates, key=key)
+        used_players.add(target['id'])
+        return target
+
+    for norm_pos, end in app.NRL_STARTING_ORDER:
+        target = pick(norm_pos, end)
+        if target:
+            result.append(target)
+    bench = [p for p in players if p['norm_pos'] == 'Bench' and p['id'] not in used_players]
+    bench = [p for p in bench if p['jersey_number'] is not None]
+    bench.sort(key=lambda x: x['jersey_number'])
+    for p in bench[:4]:
+        used_players.add(p['id'])
+        result.append(p)
+    return result
+
+
+POSITIONS = ['FB', 'Fullback', 'WG', 'Wing', 'CE', 'Centre', 'FE', 'HB', 'PR', 'Front row', 'HK',
+             'SR', 'Second row', 'LK', 'Interchange', 'Bench', 'Reserve', 'Utility']
+
+
+def random_team(rng):
+    """A squad with clashing jerseys, repeated player ids and missing jersey numbers."""
+    return [
+        {
+            "id": rng.randrange(25),
+            "name": f"p{i}",
+            "position": rng.choice(POSITIONS),
+            "jersey_number": None if rng.random() < 0.1 else rng.randrange(1, 22),
+        }
+        for i in range(rng.randrange(0, 30))
+    ]
+
+
+def test_order_matches_legacy_implementation():
+    rng = random.Random(15)
+    for _ in range(3000):
+        players = random_team(rng)
+        expected = legacy_order_nrl_team_list(copy.deepcopy(players))
+        assert app.order_nrl_team_list(copy.deepcopy(players)) == expected